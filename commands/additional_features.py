@@ -1,6 +1,7 @@
 import discord
 from discord.ext import commands
 import logging
+from utils.jobs import is_transient_error
 
 logger = logging.getLogger(__name__)
 
@@ -8,8 +9,12 @@ class AdditionalFeatures(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
     
-    async def send_tutorial_message(self, user: discord.Member, channel: discord.TextChannel):
-        """Send tutorial message after successful verification"""
+    async def send_tutorial_message(self, user: discord.Member, channel: discord.TextChannel) -> bool:
+        """Send tutorial message after successful verification
+        
+        Returns whether it was sent. Transient Discord errors are raised so
+        the verification job queue can retry the send.
+        """
         try:
             guild_id = str(user.guild.id)
             
@@ -18,16 +23,16 @@ class AdditionalFeatures(commands.Cog):
             custom_message = tutorial_config.get('message', '')
             custom_color = tutorial_config.get('color', '#00ff7f')
             
-            logger.info(f"[TUTORIAL] Sending tutorial message to {user.display_name} in {channel.name}")
-            logger.info(f"[TUTORIAL] Config: {tutorial_config}")
+            logger.debug(f"[TUTORIAL] Sending tutorial message to {user.display_name} in {channel.name}")
+            logger.debug(f"[TUTORIAL] Config: {tutorial_config}")
             
             bot_permissions = channel.permissions_for(channel.guild.me)
             if not bot_permissions.send_messages:
                 logger.error(f"[TUTORIAL] Bot lacks send_messages permission in {channel.name}")
-                return
+                return False
             if not bot_permissions.embed_links:
                 logger.error(f"[TUTORIAL] Bot lacks embed_links permission in {channel.name}")
-                return
+                return False
             
             if custom_message:
                 # Use custom message with placeholders
@@ -81,16 +86,25 @@ class AdditionalFeatures(commands.Cog):
             
             try:
                 await channel.send(embed=embed)
-                logger.info(f"[TUTORIAL] Successfully sent tutorial message to {channel.name}")
+                logger.debug(f"[TUTORIAL] Successfully sent tutorial message to {channel.name}")
+                return True
             except discord.Forbidden:
                 logger.error(f"[TUTORIAL] No permission to send message in {channel.name}")
             except discord.HTTPException as e:
+                if is_transient_error(e):
+                    raise
                 logger.error(f"[TUTORIAL] HTTP error sending message: {e}")
             except Exception as e:
+                if is_transient_error(e):
+                    raise
                 logger.error(f"[TUTORIAL] Unexpected error sending message: {e}")
+            return False
                 
         except Exception as e:
+            if is_transient_error(e):
+                raise
             logger.error(f"[TUTORIAL] Error in send_tutorial_message: {e}")
+            return False
 
     @commands.command(name='settutorial')
     @commands.has_permissions(manage_guild=True)
@@ -155,7 +169,8 @@ class AdditionalFeatures(commands.Cog):
         
         embed.add_field(name="Available Placeholders", value="`{mention}` `{user}` `{server}`", inline=False)
         
-        self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
         
         await ctx.send(embed=embed)
     
@@ -231,7 +246,8 @@ class AdditionalFeatures(commands.Cog):
             else:
                 embed.add_field(name="Status", value="No command-only channels configured", inline=False)
         
-        self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
         
         await ctx.send(embed=embed)
 
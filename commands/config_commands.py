@@ -26,7 +26,7 @@ class ConfigCommands(commands.Cog):
             key = match[0]
             value = match[1] if match[1] else match[2]  # Use quoted value if available, otherwise unquoted
             
-            if key in ['autokick', 'autoban']:
+            if key in ['autokick', 'autoban', 'expire']:
                 try:
                     options[key] = int(value)
                 except ValueError:
@@ -35,6 +35,15 @@ class ConfigCommands(commands.Cog):
                 options[key] = value.strip()
         
         return options
+    
+    def parse_color(self, value):
+        """Normalize a hex color option to ``#rrggbb`` form, or None if it is not hex"""
+        color_value = value if value.startswith('#') else '#' + value
+        try:
+            int(color_value[1:], 16)
+        except ValueError:
+            return None
+        return color_value
 
     @commands.command(name='setwelcome')
     @commands.has_permissions(manage_guild=True)
@@ -90,6 +99,14 @@ class ConfigCommands(commands.Cog):
         if not channel:
             channel = ctx.channel
         
+        # Validate everything before touching the live config
+        options = self.parse_options(options_args)
+        if 'color' in options:
+            options['color'] = self.parse_color(options['color'])
+            if options['color'] is None:
+                await ctx.send("❌ Invalid color format! Use hex format like #095fdf")
+                return
+        
         guild_id = str(ctx.guild.id)
         if guild_id not in self.bot.guild_configs:
             self.bot.guild_configs[guild_id] = {}
@@ -98,24 +115,13 @@ class ConfigCommands(commands.Cog):
             self.bot.guild_configs[guild_id]['welcome'] = {}
         
         config = self.bot.guild_configs[guild_id]['welcome']
-        options = self.parse_options(options_args)
         
         # Update configuration
         config['enabled'] = True
         config['channel_id'] = channel.id
         
         if 'color' in options:
-            # Validate hex color
-            color_value = options['color']
-            if not color_value.startswith('#'):
-                color_value = '#' + color_value
-            try:
-                int(color_value.replace('#', ''), 16)
-                config['color'] = color_value
-            except ValueError:
-                await ctx.send("❌ Invalid color format! Use hex format like #095fdf")
-                return
-                
+            config['color'] = options['color']
         if 'message' in options:
             config['message'] = options['message']
         if 'gif' in options:
@@ -124,7 +130,8 @@ class ConfigCommands(commands.Cog):
             config['thumbnail'] = options['thumbnail']
         
         # Save configuration immediately
-        self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
         
         embed = discord.Embed(
             title="✅ Welcome Messages Configured",
@@ -190,6 +197,14 @@ class ConfigCommands(commands.Cog):
         if not channel:
             channel = ctx.channel
         
+        # Validate everything before touching the live config
+        options = self.parse_options(options_args)
+        if 'color' in options:
+            options['color'] = self.parse_color(options['color'])
+            if options['color'] is None:
+                await ctx.send("❌ Invalid color format! Use hex format like #ff0000")
+                return
+        
         guild_id = str(ctx.guild.id)
         if guild_id not in self.bot.guild_configs:
             self.bot.guild_configs[guild_id] = {}
@@ -198,24 +213,13 @@ class ConfigCommands(commands.Cog):
             self.bot.guild_configs[guild_id]['goodbye'] = {}
         
         config = self.bot.guild_configs[guild_id]['goodbye']
-        options = self.parse_options(options_args)
         
         # Update configuration
         config['enabled'] = True
         config['channel_id'] = channel.id
         
         if 'color' in options:
-            # Validate hex color
-            color_value = options['color']
-            if not color_value.startswith('#'):
-                color_value = '#' + color_value
-            try:
-                int(color_value.replace('#', ''), 16)
-                config['color'] = color_value
-            except ValueError:
-                await ctx.send("❌ Invalid color format! Use hex format like #ff0000")
-                return
-                
+            config['color'] = options['color']
         if 'message' in options:
             config['message'] = options['message']
         if 'gif' in options:
@@ -224,7 +228,8 @@ class ConfigCommands(commands.Cog):
             config['thumbnail'] = options['thumbnail']
         
         # Save configuration immediately
-        self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
         
         embed = discord.Embed(
             title="✅ Goodbye Messages Configured",
@@ -271,7 +276,8 @@ class ConfigCommands(commands.Cog):
         if action == 'disable':
             config['enabled'] = False
             # Save configuration immediately
-            self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+            self.bot.mark_dirty("guild_configs", guild_id)
+            await self.bot.save_data("guild_configs")
             embed = discord.Embed(
                 title="✅ Leveling Disabled",
                 description="Auto-leveling system has been disabled",
@@ -284,29 +290,26 @@ class ConfigCommands(commands.Cog):
             await ctx.send("❌ Please specify a channel for level-up announcements!")
             return
         
+        # Validate everything before touching the live config
         options = self.parse_options(args)
+        if 'color' in options:
+            options['color'] = self.parse_color(options['color'])
+            if options['color'] is None:
+                await ctx.send("❌ Invalid color format! Use hex format like #ffd700")
+                return
         
         # Update configuration
         config['enabled'] = True
         config['channel_id'] = channel.id
         
         if 'color' in options:
-            # Validate hex color
-            color_value = options['color']
-            if not color_value.startswith('#'):
-                color_value = '#' + color_value
-            try:
-                int(color_value.replace('#', ''), 16)
-                config['color'] = color_value
-            except ValueError:
-                await ctx.send("❌ Invalid color format! Use hex format like #ffd700")
-                return
-                
+            config['color'] = options['color']
         if 'message' in options:
             config['message'] = options['message']
         
         # Save configuration immediately
-        self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
         
         embed = discord.Embed(
             title="✅ Leveling System Configured",
@@ -329,7 +332,8 @@ class ConfigCommands(commands.Cog):
                 description="Usage: `!setwarnings enable #channel [options]` or `!setwarnings disable`\n\n"
                            "**Options:**\n"
                            "• `autokick=number` - Auto-kick after X warnings (1-10)\n"
-                           "• `autoban=number` - Auto-ban after X warnings (1-15)\n\n"
+                           "• `autoban=number` - Auto-ban after X warnings (1-15)\n"
+                           "• `expire=days` - Warnings expire after X days (1-365, 0 = never)\n\n"
                            "**Example:**\n"
                            "`!setwarnings enable #warnings autokick=3 autoban=5`",
                 color=0xff8c00
@@ -349,7 +353,8 @@ class ConfigCommands(commands.Cog):
         if action == 'disable':
             config['enabled'] = False
             # Save configuration immediately
-            self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+            self.bot.mark_dirty("guild_configs", guild_id)
+            await self.bot.save_data("guild_configs")
             embed = discord.Embed(
                 title="✅ Warning System Disabled",
                 description="Warning system has been disabled",
@@ -362,28 +367,32 @@ class ConfigCommands(commands.Cog):
             await ctx.send("❌ Please specify a channel for warning logs!")
             return
         
+        # Validate everything before touching the live config
         options = self.parse_options(args)
+        if 'autokick' in options and not 1 <= options['autokick'] <= 10:
+            await ctx.send("❌ Auto-kick value must be between 1 and 10!")
+            return
+        if 'autoban' in options and not 1 <= options['autoban'] <= 15:
+            await ctx.send("❌ Auto-ban value must be between 1 and 15!")
+            return
+        if 'expire' in options and not 0 <= options['expire'] <= 365:
+            await ctx.send("❌ Expiry must be between 0 and 365 days!")
+            return
         
         # Update configuration
         config['enabled'] = True
         config['log_channel_id'] = channel.id
         
         if 'autokick' in options:
-            if 1 <= options['autokick'] <= 10:
-                config['autokick'] = options['autokick']
-            else:
-                await ctx.send("❌ Auto-kick value must be between 1 and 10!")
-                return
-        
+            config['autokick'] = options['autokick']
         if 'autoban' in options:
-            if 1 <= options['autoban'] <= 15:
-                config['autoban'] = options['autoban']
-            else:
-                await ctx.send("❌ Auto-ban value must be between 1 and 15!")
-                return
+            config['autoban'] = options['autoban']
+        if 'expire' in options:
+            config['expire_days'] = options['expire'] or None
         
-        # Save configuration immediately
-        self.bot.save_json("guild_configs.json", self.bot.guild_configs)
+        # Save configuration immediately (a new expiry only applies to warnings issued from now on)
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
         
         embed = discord.Embed(
             title="✅ Warning System Configured",
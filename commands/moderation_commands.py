@@ -1,23 +1,42 @@
 import discord
 from discord.ext import commands
 from datetime import datetime
-import json
+import re
+import time
+from typing import Dict, List, Optional, Tuple
+from utils.outbox import Outbox
+from utils.warning_log import moderator_keys
+from utils.workers import PoolResult, WorkerPool
+
+MODLOG_PAGE_SIZE = 10
+MASS_ACTION_LIMIT = 100
+MASS_ACTIONS = {
+    'warn': ("⚠️ Mass Warn", "warned", 0xff8c00),
+    'kick': ("👢 Mass Kick", "kicked", 0xff8c00),
+    'ban': ("🔨 Mass Ban", "banned", 0xff0000)
+}
+MASS_USAGE = "[@members...] [role:@Role] [joined:10m] [reason]"
+DURATION = re.compile(r'^(\d+)([mhdw])$')
+DURATION_SECONDS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+def parse_time(value: str) -> float:
+    """``7d``/``12h``/``30m``/``2w`` ago, or an ISO date, as a Unix time"""
+    match = DURATION.match(value.lower())
+    if match:
+        return time.time() - int(match.group(1)) * DURATION_SECONDS[match.group(2)]
+    return datetime.fromisoformat(value).timestamp()
+
+def mention_list(members: List[discord.Member], limit: int = 1000) -> str:
+    text = ""
+    for shown, member in enumerate(members):
+        if len(text) + len(member.mention) + 2 > limit:
+            return text + f"… and {len(members) - shown} more"
+        text += (", " if text else "") + member.mention
+    return text or "None"
 
 class ModerationCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.load_warnings()
-    
-    def load_warnings(self):
-        try:
-            with open("user_warnings.json", "r") as file:
-                self.bot.user_warnings = json.load(file)
-        except FileNotFoundError:
-            self.bot.user_warnings = {}
-    
-    def save_json(self, filename, data):
-        with open(filename, "w") as file:
-            json.dump(data, file, indent=4)
     
     @commands.command(name='warn')
     @commands.has_permissions(moderate_members=True)
@@ -38,25 +57,14 @@ class ModerationCommands(commands.Cog):
         guild_id = str(ctx.guild.id)
         user_id = str(member.id)
         
-        # Initialize warning data
-        if guild_id not in self.bot.user_warnings:
-            self.bot.user_warnings[guild_id] = {}
-        
-        if user_id not in self.bot.user_warnings[guild_id]:
-            self.bot.user_warnings[guild_id][user_id] = []
-        
-        # Add warning
-        warning_data = {
+        # Add warning (appended to the guild's warning log and journal)
+        warning_data = await self.bot.add_warning(guild_id, user_id, {
             'reason': reason,
             'moderator': ctx.author.name,
-            'timestamp': datetime.now().isoformat(),
-            'id': len(self.bot.user_warnings[guild_id][user_id]) + 1
-        }
-        
-        self.bot.user_warnings[guild_id][user_id].append(warning_data)
-        warning_count = len(self.bot.user_warnings[guild_id][user_id])
-        
-        self.save_json("user_warnings.json", self.bot.user_warnings)
+            'moderator_id': ctx.author.id,
+            'timestamp': datetime.now().isoformat()
+        })
+        warning_count = await self.bot.active_warnings(guild_id, user_id)
         
         # Create warning embed
         embed = discord.Embed(
@@ -65,23 +73,22 @@ class ModerationCommands(commands.Cog):
         )
         embed.add_field(name="User", value=member.mention, inline=True)
         embed.add_field(name="Moderator", value=ctx.author.mention, inline=True)
-        embed.add_field(name="Warning Count", value=str(warning_count), inline=True)
+        embed.add_field(name="Active Warnings", value=str(warning_count), inline=True)
         embed.add_field(name="Reason", value=reason, inline=False)
+        if warning_data.get('expires_at'):
+            embed.add_field(name="Expires", value=f"<t:{int(warning_data['expires_at'])}:R>", inline=True)
         embed.set_footer(text=f"Warning ID: {warning_data['id']}")
         
-        await ctx.send(embed=embed)
+        # Here and in the log channel if configured (once if they are the same channel).
+        # Queued, so an auto-kick/ban notice below goes out in the same message.
+        channels = [ctx.channel]
+        log_channel = self.log_channel(ctx)
+        if log_channel and log_channel.id != ctx.channel.id:
+            channels.append(log_channel)
+        for channel in channels:
+            self.bot.outbox.post(channel, embed, Outbox.MODERATION)
         
-        # Send to log channel if configured
         config = self.bot.guild_configs.get(guild_id, {}).get('warnings', {})
-        if config.get('enabled', False):
-            log_channel_id = config.get('log_channel_id')
-            if log_channel_id:
-                log_channel = ctx.guild.get_channel(log_channel_id)
-                if log_channel:
-                    try:
-                        await log_channel.send(embed=embed)
-                    except discord.Forbidden:
-                        pass
         
         # Check for auto-kick/ban
         autokick = config.get('autokick')
@@ -95,7 +102,8 @@ class ModerationCommands(commands.Cog):
                     description=f"{member.mention} has been banned for reaching {autoban} warnings",
                     color=0xff0000
                 )
-                await ctx.send(embed=ban_embed)
+                for channel in channels:
+                    self.bot.outbox.post(channel, ban_embed, Outbox.MODERATION)
             elif autokick and warning_count >= autokick:
                 await member.kick(reason=f"Auto-kick: {autokick} warnings reached")
                 kick_embed = discord.Embed(
@@ -103,7 +111,8 @@ class ModerationCommands(commands.Cog):
                     description=f"{member.mention} has been kicked for reaching {autokick} warnings",
                     color=0xff8c00
                 )
-                await ctx.send(embed=kick_embed)
+                for channel in channels:
+                    self.bot.outbox.post(channel, kick_embed, Outbox.MODERATION)
         except discord.Forbidden:
             await ctx.send("❌ I don't have permission to kick/ban this user!")
     
@@ -114,20 +123,24 @@ class ModerationCommands(commands.Cog):
         guild_id = str(ctx.guild.id)
         user_id = str(member.id)
         
-        warnings = self.bot.user_warnings.get(guild_id, {}).get(user_id, [])
+        log = await self.bot.guild_warnings(guild_id)  # Marks anything already expired
+        warnings = log.active(user_id) if log is not None else []
+        expired = len(log.get(user_id, ())) - len(warnings) if log is not None else 0
         
         if not warnings:
             embed = discord.Embed(
                 title="📋 User Warnings",
-                description=f"{member.mention} has no warnings",
+                description=f"{member.mention} has no active warnings",
                 color=0x00ff00
             )
+            if expired:
+                embed.set_footer(text=f"{expired} expired warning(s) are still listed in !modlog")
             await ctx.send(embed=embed)
             return
         
         embed = discord.Embed(
             title="📋 User Warnings",
-            description=f"{member.mention} has {len(warnings)} warning(s)",
+            description=f"{member.mention} has {len(warnings)} active warning(s)",
             color=0xff8c00
         )
         
@@ -136,12 +149,258 @@ class ModerationCommands(commands.Cog):
                 name=f"Warning #{warning['id']}",
                 value=f"**Reason:** {warning['reason']}\n"
                       f"**Moderator:** {warning['moderator']}\n"
-                      f"**Date:** {warning['timestamp'][:10]}",
+                      f"**Date:** {warning['timestamp'][:10]}"
+                      + (f"\n**Expires:** <t:{int(warning['expires_at'])}:R>" if warning.get('expires_at') else ""),
                 inline=False
             )
         
+        footer = []
         if len(warnings) > 5:
-            embed.set_footer(text=f"Showing last 5 of {len(warnings)} warnings")
+            footer.append(f"Showing last 5 of {len(warnings)} active warnings")
+        if expired:
+            footer.append(f"{expired} expired warning(s) in !modlog")
+        if footer:
+            embed.set_footer(text=" • ".join(footer))
+        
+        await ctx.send(embed=embed)
+
+    @commands.command(name='masswarn')
+    @commands.has_permissions(moderate_members=True)
+    async def mass_warn(self, ctx, members: commands.Greedy[discord.Member], *, args: str = ""):
+        """Warn many members at once
+        Usage: !masswarn [@members...] [role:@Role] [joined:10m] [reason]
+        """
+        await self.mass_action(ctx, 'warn', members, args)
+    
+    @commands.command(name='masskick')
+    @commands.has_permissions(kick_members=True)
+    async def mass_kick(self, ctx, members: commands.Greedy[discord.Member], *, args: str = ""):
+        """Kick many members at once
+        Usage: !masskick [@members...] [role:@Role] [joined:10m] [reason]
+        """
+        await self.mass_action(ctx, 'kick', members, args)
+    
+    @commands.command(name='massban')
+    @commands.has_permissions(ban_members=True)
+    async def mass_ban(self, ctx, members: commands.Greedy[discord.Member], *, args: str = ""):
+        """Ban many members at once
+        Usage: !massban [@members...] [role:@Role] [joined:10m] [reason]
+        """
+        await self.mass_action(ctx, 'ban', members, args)
+    
+    def log_channel(self, ctx) -> Optional[discord.TextChannel]:
+        """The server's warnings log channel, if logging is enabled"""
+        config = self.bot.guild_configs.get(str(ctx.guild.id), {}).get('warnings', {})
+        if not config.get('enabled', False) or not config.get('log_channel_id'):
+            return None
+        return ctx.guild.get_channel(config['log_channel_id'])
+    
+    async def resolve_targets(self, ctx, members: List[discord.Member], args: str) -> Tuple[List[discord.Member], str]:
+        """Members named directly plus ``role:``/``joined:`` selectors; the words after them are the reason"""
+        targets: Dict[int, discord.Member] = {member.id: member for member in members}
+        reason_words = []
+        for token in args.split():
+            key, _, value = token.partition(':')
+            key = key.lower()
+            if key == 'role' and value and not reason_words:
+                role = await commands.RoleConverter().convert(ctx, value)
+                for member in role.members:
+                    targets.setdefault(member.id, member)
+            elif key == 'joined' and value and not reason_words:
+                since = parse_time(value)
+                for member in ctx.guild.members:
+                    if member.joined_at and member.joined_at.timestamp() >= since:
+                        targets.setdefault(member.id, member)
+            else:
+                reason_words.append(token)
+        return list(targets.values()), " ".join(reason_words) or "No reason provided"
+    
+    def can_act_on(self, ctx, member: discord.Member, action: str) -> bool:
+        """Same rules as !warn, plus the bot's own role position for kicks and bans"""
+        if member.bot or member == ctx.author or member.top_role >= ctx.author.top_role:
+            return False
+        if action != 'warn' and member.top_role >= ctx.guild.me.top_role:
+            return False
+        return True
+    
+    def mass_embed(self, action: str, status: str, total: int, result: PoolResult = None) -> discord.Embed:
+        title, _, color = MASS_ACTIONS[action]
+        embed = discord.Embed(title=f"{title} {status}", color=color)
+        if result is not None:
+            embed.description = f"{result.done}/{result.total} done, {result.failed} failed"
+        else:
+            embed.description = f"{total} member(s) selected"
+        return embed
+    
+    async def mass_action(self, ctx, action: str, members: List[discord.Member], args: str):
+        """Warn, kick or ban a list of members through the rate-limited moderation pool
+        
+        Warnings are added as one batch; kicks and bans (including auto
+        actions from warning thresholds) run concurrently, and a single embed
+        is edited with the progress.
+        """
+        title, done_word, color = MASS_ACTIONS[action]
+        try:
+            targets, reason = await self.resolve_targets(ctx, members, args)
+        except (commands.BadArgument, ValueError):
+            await ctx.send(f"❌ Usage: `!mass{action} {MASS_USAGE}`")
+            return
+        
+        eligible = [member for member in targets if self.can_act_on(ctx, member, action)]
+        skipped = len(targets) - len(eligible)
+        if not eligible:
+            await ctx.send(f"❌ No members to {action}. Usage: `!mass{action} {MASS_USAGE}`")
+            return
+        if len(eligible) > MASS_ACTION_LIMIT:
+            await ctx.send(f"❌ That selects {len(eligible)} members; the limit is {MASS_ACTION_LIMIT} per command.")
+            return
+        
+        message = await ctx.send(embed=self.mass_embed(action, "in progress...", len(eligible)))
+        guild_id = str(ctx.guild.id)
+        audit_reason = f"{reason} (mass {action} by {ctx.author})"[:512]
+        
+        # Warnings are one batch; only members crossing a threshold need a Discord call
+        work: List[Tuple[discord.Member, str]] = []
+        if action == 'warn':
+            timestamp = datetime.now().isoformat()
+            await self.bot.add_warnings(guild_id, [
+                (str(member.id), {
+                    'reason': reason,
+                    'moderator': ctx.author.name,
+                    'moderator_id': ctx.author.id,
+                    'timestamp': timestamp
+                })
+                for member in eligible
+            ])
+            config = self.bot.guild_configs.get(guild_id, {}).get('warnings', {})
+            autokick = config.get('autokick')
+            autoban = config.get('autoban')
+            log = await self.bot.guild_warnings(guild_id)
+            for member in eligible:
+                count = log.count(str(member.id))
+                if autoban and count >= autoban:
+                    work.append((member, 'ban'))
+                elif autokick and count >= autokick:
+                    work.append((member, 'kick'))
+        else:
+            work = [(member, action) for member in eligible]
+        
+        failed: List[discord.Member] = []
+        actioned: Dict[str, List[discord.Member]] = {'kick': [], 'ban': []}
+        
+        async def apply(item: Tuple[discord.Member, str]):
+            member, member_action = item
+            request = member.ban if member_action == 'ban' else member.kick
+            try:
+                await self.bot.discord_request(request, reason=audit_reason)
+            except discord.HTTPException:
+                failed.append(member)
+                raise
+            actioned[member_action].append(member)
+        
+        async def progress(result: PoolResult):
+            await message.edit(embed=self.mass_embed(action, "in progress...", len(eligible), result))
+        
+        pool = WorkerPool(f"Mass {action} in {ctx.guild.name}", self.bot.moderation_concurrency, progress_interval=2.0)
+        result = await pool.run(work, apply, on_progress=progress)
+        
+        embed = discord.Embed(title=f"{title} Complete", color=color)
+        embed.add_field(name="Moderator", value=ctx.author.mention, inline=True)
+        if action == 'warn':
+            embed.add_field(name="Warned", value=str(len(eligible)), inline=True)
+            if actioned['kick'] or actioned['ban']:
+                embed.add_field(name="Auto-Kicked / Auto-Banned", value=f"{len(actioned['kick'])} / {len(actioned['ban'])}", inline=True)
+        else:
+            embed.add_field(name=done_word.capitalize(), value=str(len(actioned[action])), inline=True)
+        if failed:
+            embed.add_field(name="Failed", value=mention_list(failed), inline=False)
+        if skipped:
+            embed.add_field(name="Skipped", value=f"{skipped} (bots, yourself or members with an equal/higher role)", inline=False)
+        embed.add_field(name="Reason", value=reason[:1024], inline=False)
+        embed.add_field(name="Members", value=mention_list(eligible), inline=False)
+        embed.set_footer(text=f"Finished in {result.elapsed:.1f}s")
+        await message.edit(embed=embed)
+        
+        # One summary in the log channel instead of an embed per member
+        log_channel = self.log_channel(ctx)
+        if log_channel and log_channel.id != ctx.channel.id:
+            self.bot.outbox.post(log_channel, embed, Outbox.MODERATION)
+    
+    @commands.command(name='modlog')
+    @commands.has_permissions(moderate_members=True)
+    async def mod_log(self, ctx, *, query: str = ""):
+        """Search this server's warnings
+        Usage: !modlog [mod:@user] [user:@user] [since:7d] [until:2024-06-01] [reason words...] [page:N]
+        """
+        guild_id = str(ctx.guild.id)
+        moderators = None
+        user = None
+        since = until = None
+        words = []
+        page = 1
+        
+        for token in query.split():
+            key, _, value = token.partition(':')
+            key = key.lower()
+            try:
+                if value and key in ('mod', 'moderator'):
+                    try:
+                        moderator = await commands.MemberConverter().convert(ctx, value)
+                        keys = moderator_keys({'moderator_id': moderator.id, 'moderator': moderator.name})
+                    except commands.BadArgument:
+                        keys = moderator_keys({'moderator': value})
+                    moderators = (moderators or set()) | keys
+                elif value and key == 'user':
+                    user = await commands.MemberConverter().convert(ctx, value)
+                elif value and key == 'since':
+                    since = parse_time(value)
+                elif value and key == 'until':
+                    until = parse_time(value)
+                elif value and key == 'page':
+                    page = max(1, int(value))
+                elif key == 'reason' and value:
+                    words.extend(value.split(','))
+                else:
+                    words.append(token)
+            except (commands.BadArgument, ValueError):
+                await ctx.send(f"❌ Could not understand `{token}`. Usage: `!modlog [mod:@user] [user:@user] [since:7d] [until:2024-06-01] [reason words] [page:N]`")
+                return
+        
+        log = await self.bot.guild_warnings(guild_id)
+        if log is None or len(log) == 0:
+            await ctx.send("📋 This server has no warnings.")
+            return
+        
+        search = await log.search()
+        started = time.perf_counter()
+        matches = search.query(
+            moderators=moderators,
+            users=log.user_keys(str(user.id)) if user else None,
+            words=[word for word in words if word],
+            since=since,
+            until=until
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        total_pages = max(1, -(-len(matches) // MODLOG_PAGE_SIZE))
+        page = min(page, total_pages)
+        start = (page - 1) * MODLOG_PAGE_SIZE
+        
+        embed = discord.Embed(
+            title="📋 Moderation Log",
+            description=f"{len(matches)} matching warning(s)" + (f" for `{query}`" if query else ""),
+            color=0xff8c00
+        )
+        for key in matches[start:start + MODLOG_PAGE_SIZE]:
+            issued, user_id, warning_id = key
+            warning = search.get(key)
+            moderator = f"<@{warning['moderator_id']}>" if warning.get('moderator_id') else warning.get('moderator', 'unknown')
+            embed.add_field(
+                name=f"Warning #{warning_id} • {warning.get('timestamp', '')[:10]}" + (" (expired)" if warning.get('expired') else ""),
+                value=f"**User:** <@{user_id}>\n**Moderator:** {moderator}\n**Reason:** {warning.get('reason', '')[:200]}",
+                inline=False
+            )
+        embed.set_footer(text=f"Page {page}/{total_pages} • {len(search)} warnings searched in {elapsed_ms:.1f} ms")
         
         await ctx.send(embed=embed)
 
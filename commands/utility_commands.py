@@ -1,5 +1,8 @@
 import discord
 from discord.ext import commands
+from utils.levels import total_xp
+
+LEADERBOARD_PAGE_SIZE = 10
 
 class UtilityCommands(commands.Cog):
     def __init__(self, bot):
@@ -14,6 +17,7 @@ class UtilityCommands(commands.Cog):
         guild_id = str(ctx.guild.id)
         user_id = str(member.id)
         
+        await self.bot.load_guild_data("user_levels", guild_id)
         user_data = self.bot.user_levels.get(guild_id, {}).get(user_id, {'xp': 0, 'level': 1})
         
         embed = discord.Embed(
@@ -35,6 +39,68 @@ class UtilityCommands(commands.Cog):
         
         await ctx.send(embed=embed)
     
+    @commands.command(name='leaderboard', aliases=['lb', 'top'])
+    async def leaderboard(self, ctx, page: int = 1):
+        """Show the server's XP leaderboard"""
+        guild_id = str(ctx.guild.id)
+        await self.bot.load_guild_data("user_levels", guild_id)
+        index = self.bot.get_rank_index(guild_id)
+        
+        if not index or len(index) == 0:
+            await ctx.send("❌ Nobody has earned any XP in this server yet!")
+            return
+        
+        pages = (len(index) + LEADERBOARD_PAGE_SIZE - 1) // LEADERBOARD_PAGE_SIZE
+        if page < 1 or page > pages:
+            await ctx.send(f"❌ Page must be between 1 and {pages}!")
+            return
+        
+        levels = self.bot.user_levels[guild_id]
+        lines = []
+        for rank, user_id, total in index.page(page, LEADERBOARD_PAGE_SIZE):
+            level = levels[user_id]['level']
+            lines.append(f"**#{rank}** <@{user_id}> - Level {level} ({total:,} XP)")
+        
+        embed = discord.Embed(
+            title=f"🏆 {ctx.guild.name} Leaderboard",
+            description="\n".join(lines),
+            color=0xffd700
+        )
+        embed.set_footer(text=f"Page {page}/{pages} • {len(index)} ranked members")
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='rank')
+    async def rank(self, ctx, member: discord.Member = None):
+        """Show a user's position on the XP leaderboard"""
+        if not member:
+            member = ctx.author
+        
+        guild_id = str(ctx.guild.id)
+        user_id = str(member.id)
+        
+        await self.bot.load_guild_data("user_levels", guild_id)
+        index = self.bot.get_rank_index(guild_id)
+        position = index.rank(user_id) if index else None
+        
+        if position is None:
+            await ctx.send(f"❌ {member.mention} hasn't earned any XP yet!")
+            return
+        
+        user_data = self.bot.user_levels[guild_id][user_id]
+        
+        embed = discord.Embed(
+            title="🏆 Rank",
+            color=0xffd700
+        )
+        embed.set_thumbnail(url=member.display_avatar.url)
+        embed.add_field(name="User", value=member.mention, inline=True)
+        embed.add_field(name="Rank", value=f"#{position} of {len(index)}", inline=True)
+        embed.add_field(name="Level", value=str(user_data['level']), inline=True)
+        embed.add_field(name="Total XP", value=f"{total_xp(user_data['level'], user_data['xp']):,}", inline=True)
+        
+        await ctx.send(embed=embed)
+    
     @commands.command(name='help')
     async def help_command(self, ctx, command_name=None):
         """Show help information"""
@@ -94,13 +160,17 @@ class UtilityCommands(commands.Cog):
         # Moderation Commands
         mod_commands = [
             "`!warn <user> [reason]` - Warn a user",
-            "`!warnings <user>` - View user warnings"
+            "`!warnings <user>` - View user warnings",
+            "`!modlog [filters]` - Search warnings by moderator, user, date or reason",
+            "`!masswarn`/`!masskick`/`!massban [@users] [role:@Role] [joined:10m] [reason]` - Act on many members"
         ]
         embed.add_field(name="🛡️ Moderation", value="\n".join(mod_commands), inline=False)
         
         # Utility Commands
         utility_commands = [
             "`!level [user]` - Check level/XP",
+            "`!rank [user]` - Show leaderboard position",
+            "`!leaderboard [page]` - Show the XP leaderboard",
             "`!help [command]` - Show help information"
         ]
         embed.add_field(name="📊 Utility", value="\n".join(utility_commands), inline=False)
@@ -108,7 +178,11 @@ class UtilityCommands(commands.Cog):
         # Verification & Special Features
         verification_commands = [
             "`!verify <username>` - Verify Roblox account",
-            "`!setkeyword <keyword> <role>` - Set verification keyword",
+            "`!setkeyword <keyword> <role>` - Add a verification keyword rule",
+            "`!keywords` - List verification keyword rules",
+            "`!removekeyword <keyword>` - Remove a keyword rule",
+            "`!whoverified <roblox>` - Show who verified a Roblox account",
+            "`!unverify [@user]` - Remove a Roblox verification",
             "`!getpicture [@user]` - Get user's profile picture"
         ]
         embed.add_field(name="🔐 Verification & Features", value="\n".join(verification_commands), inline=False)
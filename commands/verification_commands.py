@@ -2,9 +2,24 @@ import discord
 from discord.ext import commands
 import aiohttp
 import logging
+from typing import List
+from utils.circuit_breaker import CircuitOpenError
+from utils.keyword_roles import REGEX_PREFIX, describe_rule, editable_rules, keyword_rules
+import re
 
 logger = logging.getLogger(__name__)
 
+PENDING = "⏳ Updating..."
+
+def roblox_unavailable_embed(retry_after: float) -> discord.Embed:
+    """Reply used while the Roblox API circuit is open"""
+    minutes = max(1, int(retry_after // 60) + 1)
+    return discord.Embed(
+        title="⏳ Roblox Is Unavailable",
+        description=f"Roblox isn't responding right now, so verification is paused.\n\nPlease try again in about {minutes} minute(s).",
+        color=0xffa500
+    )
+
 class VerificationCommands(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -20,10 +35,14 @@ class VerificationCommands(commands.Cog):
         )
         message = await ctx.send(embed=embed)
         
-        # Fetch Roblox display name
-        display_name = await self.bot.get_roblox_display_name(username)
+        # Look up the Roblox account
+        try:
+            account = await self.bot.get_roblox_user(username)
+        except CircuitOpenError as e:
+            await message.edit(embed=roblox_unavailable_embed(e.retry_after))
+            return
         
-        if not display_name:
+        if not account:
             embed = discord.Embed(
                 title="❌ Verification Failed",
                 description=f"Could not find Roblox user: `{username}`\n\nPlease check the username and try again.",
@@ -32,31 +51,34 @@ class VerificationCommands(commands.Cog):
             await message.edit(embed=embed)
             return
         
-        # Update Discord nickname
-        try:
-            await ctx.author.edit(nick=display_name)
-            nickname_updated = True
-        except discord.Forbidden:
-            nickname_updated = False
+        display_name = account['displayName']
+        username = account['name']
         
-        # Store verification data
         guild_id = str(ctx.guild.id)
         user_id = str(ctx.author.id)
         
-        if guild_id not in self.bot.verification_data:
-            self.bot.verification_data[guild_id] = {}
+        # Servers can require each Roblox account to be verified by only one member
+        claimed_by = self.other_claims(account['id'], guild_id, user_id)
+        if claimed_by and self.unique_accounts(guild_id):
+            embed = discord.Embed(
+                title="❌ Account Already Verified",
+                description=f"`{username}` is already verified by {self.mention_users(claimed_by)} in this server.\n\nAsk an admin if this is your account.",
+                color=0xff0000
+            )
+            await message.edit(embed=embed)
+            return
         
-        self.bot.verification_data[guild_id][user_id] = {
+        # Store verification data
+        self.bot.save_verification(guild_id, user_id, {
+            'roblox_id': account['id'],
             'roblox_username': username,
             'display_name': display_name,
             'verified_at': discord.utils.utcnow().isoformat(),
+            'last_checked': discord.utils.utcnow().timestamp(),
             'discord_user': ctx.author.name
-        }
+        })
         
-        # Handle role assignment
-        await self.bot.handle_role_assignment(ctx.author, display_name, guild_id)
-        
-        # Create success embed
+        # Reply now; the member edit and tutorial run on the job queue and fill in the embed
         embed = discord.Embed(
             title="✅ Verification Successful",
             color=0x00ff00
@@ -64,88 +86,184 @@ class VerificationCommands(commands.Cog):
         embed.add_field(name="Roblox Username", value=username, inline=True)
         embed.add_field(name="Display Name", value=display_name, inline=True)
         embed.add_field(name="Discord User", value=ctx.author.mention, inline=True)
-        
-        if nickname_updated:
-            embed.add_field(name="Nickname Updated", value="✅ Yes", inline=True)
-        else:
-            embed.add_field(name="Nickname Updated", value="❌ No (Missing permissions)", inline=True)
-        
-        # Check if role was assigned
-        guild_config = self.bot.keyword_config.get(guild_id, self.bot.keyword_config)
-        keyword = guild_config.get("keyword", "OG")
-        role_name = guild_config.get("role_name", "OG member")
-        
-        if keyword.lower() in display_name.lower():
-            role = discord.utils.get(ctx.guild.roles, name=role_name)
-            if role and role in ctx.author.roles:
-                embed.add_field(name="Special Role", value=f"✅ {role_name} assigned", inline=True)
-            else:
-                embed.add_field(name="Special Role", value=f"❌ {role_name} (role not found or no permissions)", inline=True)
-        else:
-            embed.add_field(name="Special Role", value=f"No special role (keyword '{keyword}' not found)", inline=True)
-        
+        embed.add_field(name="Nickname Updated", value=PENDING, inline=True)
+        embed.add_field(name="Special Role", value=PENDING, inline=True)
         embed.set_footer(text="Your verification will be automatically checked daily for updates")
         
         await message.edit(embed=embed)
         
+        member_job = await self.bot.verification_jobs.submit(
+            lambda: self.bot.apply_verification(ctx.author, display_name, guild_id)
+        )
+        tutorial_job = None
+        tutorial_channel = self.tutorial_channel(ctx.guild)
+        additional_features = self.bot.get_cog('AdditionalFeatures')
+        if tutorial_channel and additional_features:
+            tutorial_job = await self.bot.verification_jobs.submit(
+                lambda: additional_features.send_tutorial_message(ctx.author, tutorial_channel)
+            )
+        
+        nickname_text, roles_updated = await self.member_job_result(member_job, ctx.author)
+        embed.set_field_at(3, name="Nickname Updated", value=nickname_text, inline=True)
+        
+        # Check which keyword roles were assigned
+        matched_roles, _ = self.bot.get_keyword_matcher(guild_id).plan(ctx.guild, display_name)
+        role_names = ", ".join(role.name for role in matched_roles)
+        
+        if not matched_roles:
+            special_role = "No special role (no keyword found)"
+        elif roles_updated:
+            special_role = f"✅ {role_names} assigned"
+        else:
+            special_role = f"❌ {role_names} (could not be assigned)"
+        embed.set_field_at(4, name="Special Role", value=special_role, inline=True)
+        
+        if tutorial_job:
+            try:
+                sent = await tutorial_job
+            except Exception as e:
+                logger.error(f"[VERIFY] Tutorial message for {ctx.author.name} failed: {e}")
+                sent = False
+            embed.add_field(
+                name="Tutorial",
+                value=f"✅ Sent in {tutorial_channel.mention}" if sent else "❌ Could not be sent",
+                inline=True
+            )
+        
+        await message.edit(embed=embed)
+    
+    def other_claims(self, roblox_id: int, guild_id: str, user_id: str) -> List[str]:
+        """Other members of a server verified as the same Roblox account"""
+        claims = self.bot.verification_index.claims(roblox_id, guild_id)
+        return sorted(claim_user for _, claim_user in claims if claim_user != user_id)
+    
+    def unique_accounts(self, guild_id: str) -> bool:
+        return self.bot.guild_configs.get(guild_id, {}).get('verification', {}).get('unique_accounts', False)
+    
+    @staticmethod
+    def mention_users(user_ids: List[str], limit: int = 10) -> str:
+        mentions = ", ".join(f"<@{user_id}>" for user_id in user_ids[:limit])
+        if len(user_ids) > limit:
+            mentions += f" and {len(user_ids) - limit} more"
+        return mentions
+    
+    def tutorial_channel(self, guild: discord.Guild):
+        """Channel to send the post-verification tutorial in, or None when there is none"""
+        tutorial_config = self.bot.guild_configs.get(str(guild.id), {}).get('tutorial', {})
+        if not tutorial_config.get('enabled', True):
+            logger.debug(f"[VERIFY] Tutorial disabled in {guild.name}")
+            return None
+        
+        tutorial_channel_id = tutorial_config.get('channel_id')
+        if not tutorial_channel_id:
+            logger.debug(f"[VERIFY] No tutorial channel set in {guild.name}")
+            return None
+        
+        channel = guild.get_channel(tutorial_channel_id)
+        if channel is None:
+            logger.warning(f"[VERIFY] Tutorial channel not found with ID: {tutorial_channel_id}")
+        return channel
+    
+    async def member_job_result(self, job, member: discord.Member):
+        """Wait for a queued ``apply_verification``; returns (nickname field text, roles updated)"""
         try:
-            tutorial_config = self.bot.guild_configs.get(guild_id, {}).get('tutorial', {})
-            logger.info(f"[VERIFY] Tutorial config for guild {guild_id}: {tutorial_config}")
-            
-            enabled = tutorial_config.get('enabled', True)
-            logger.info(f"[VERIFY] Tutorial enabled status: {enabled}")
-            
-            if enabled:
-                tutorial_channel_id = tutorial_config.get('channel_id')
-                logger.info(f"[VERIFY] Tutorial enabled, channel_id: {tutorial_channel_id}")
-                
-                if tutorial_channel_id:
-                    tutorial_channel = ctx.guild.get_channel(tutorial_channel_id)
-                    logger.info(f"[VERIFY] Tutorial channel found: {tutorial_channel}")
-                    
-                    if tutorial_channel:
-                        # Get the additional features cog to send tutorial
-                        additional_features = self.bot.get_cog('AdditionalFeatures')
-                        logger.info(f"[VERIFY] AdditionalFeatures cog: {additional_features}")
-                        
-                        if additional_features:
-                            await additional_features.send_tutorial_message(ctx.author, tutorial_channel)
-                            logger.info(f"[VERIFY] Tutorial message sent for {ctx.author.display_name}")
-                        else:
-                            logger.error("[VERIFY] AdditionalFeatures cog not found")
-                    else:
-                        logger.error(f"[VERIFY] Tutorial channel not found with ID: {tutorial_channel_id}")
-                else:
-                    logger.error("[VERIFY] Tutorial channel_id not set")
-            else:
-                logger.info("[VERIFY] Tutorial disabled by configuration")
+            nickname_updated, roles_updated = await job
         except Exception as e:
-            logger.error(f"[VERIFY] Error handling tutorial message: {e}")
+            logger.error(f"[VERIFY] Updating {member.name} failed after retries: {e}")
+            return "❌ No (Discord error)", False
+        if nickname_updated:
+            return "✅ Yes", roles_updated
+        return "❌ No (Missing permissions)", roles_updated
     
     @commands.command(name='setkeyword')
     @commands.has_permissions(manage_guild=True)
     async def set_keyword(self, ctx, keyword: str, *, role: discord.Role):
-        """Set the keyword and role for verification system"""
+        """Add a keyword rule (or change its role); prefix the keyword with `regex:` for a pattern"""
         guild_id = str(ctx.guild.id)
         
-        # Update keyword configuration
-        if guild_id not in self.bot.keyword_config:
-            self.bot.keyword_config[guild_id] = {}
-        
-        self.bot.keyword_config[guild_id]['keyword'] = keyword
-        self.bot.keyword_config[guild_id]['role_name'] = role.name
-        self.bot.keyword_config[guild_id]['role_id'] = role.id  # Store role ID for better reliability
+        is_regex = keyword.lower().startswith(REGEX_PREFIX)
+        pattern = keyword[len(REGEX_PREFIX):] if is_regex else keyword
+        if is_regex:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                await ctx.send(f"❌ Invalid regex `{pattern}`: {e}")
+                return
+        
+        rules = editable_rules(self.bot.keyword_config.setdefault(guild_id, {}))
+        rule = next((r for r in rules if r['pattern'] == pattern and r.get('regex', False) == is_regex), None)
+        if rule is None:
+            rule = {'pattern': pattern, 'regex': is_regex}
+            rules.append(rule)
+        rule['role_id'] = role.id
+        rule['role_name'] = role.name
+        self.bot.mark_dirty("keyword_config", guild_id)
         
         embed = discord.Embed(
             title="✅ Keyword Configuration Updated",
             color=0x00ff00
         )
-        embed.add_field(name="Keyword", value=f"`{keyword}`", inline=True)
+        embed.add_field(name="Keyword", value=f"`{describe_rule(rule)}`", inline=True)
         embed.add_field(name="Role", value=role.mention, inline=True)
-        embed.add_field(name="How it works", value=f"Users with `{keyword}` in their Roblox display name will automatically get the {role.mention} role", inline=False)
+        embed.add_field(name="Rules", value=str(len(rules)), inline=True)
+        match_text = "matching the pattern" if is_regex else f"with `{pattern}` in"
+        embed.add_field(name="How it works", value=f"Users {match_text} their Roblox display name will automatically get the {role.mention} role", inline=False)
+        embed.set_footer(text="Use !keywords to list rules and !removekeyword to remove one")
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='keywords')
+    @commands.has_permissions(manage_guild=True)
+    async def list_keywords(self, ctx):
+        """List the keyword → role rules for this server"""
+        guild_id = str(ctx.guild.id)
+        matcher = self.bot.get_keyword_matcher(guild_id)
+        
+        embed = discord.Embed(
+            title="🔑 Keyword Roles",
+            color=0x7289da
+        )
+        if not matcher.rules:
+            embed.description = "No keyword rules set. Use `!setkeyword <keyword> <role>` to add one."
+        else:
+            lines = []
+            for index, rule in enumerate(matcher.rules):
+                role = matcher.resolve_role(ctx.guild, index)
+                role_text = role.mention if role else f"{rule.get('role_name', 'unknown')} (missing)"
+                lines.append(f"• `{describe_rule(rule)}` → {role_text}")
+            # Stay under the embed description limit
+            description = ""
+            for shown, line in enumerate(lines):
+                if len(description) + len(line) > 3900:
+                    description += f"… and {len(lines) - shown} more"
+                    break
+                description += line + "\n"
+            embed.description = description
+            if guild_id not in self.bot.keyword_config:
+                embed.set_footer(text="Default rule (this server has not set its own keywords)")
         
         await ctx.send(embed=embed)
     
+    @commands.command(name='removekeyword')
+    @commands.has_permissions(manage_guild=True)
+    async def remove_keyword(self, ctx, keyword: str):
+        """Remove a keyword rule (use the same text as in !keywords)"""
+        guild_id = str(ctx.guild.id)
+        guild_config = self.bot.keyword_config.get(guild_id)
+        if guild_config is None:
+            await ctx.send("❌ This server has no keyword rules of its own.")
+            return
+        
+        rules = editable_rules(guild_config)
+        remaining = [rule for rule in rules if describe_rule(rule) != keyword]
+        if len(remaining) == len(rules):
+            await ctx.send(f"❌ No keyword rule `{keyword}` found. Use `!keywords` to list them.")
+            return
+        
+        guild_config['rules'] = remaining
+        self.bot.mark_dirty("keyword_config", guild_id)
+        await ctx.send(f"✅ Removed keyword rule `{keyword}` ({len(remaining)} rule(s) left).")
+    
     @commands.command(name='adminverify')
     @commands.has_permissions(administrator=True)
     async def admin_verify(self, ctx, roblox_username: str, discord_user: discord.Member):
@@ -158,10 +276,14 @@ class VerificationCommands(commands.Cog):
         )
         message = await ctx.send(embed=embed)
         
-        # Fetch Roblox display name
-        display_name = await self.bot.get_roblox_display_name(roblox_username)
+        # Look up the Roblox account
+        try:
+            account = await self.bot.get_roblox_user(roblox_username)
+        except CircuitOpenError as e:
+            await message.edit(embed=roblox_unavailable_embed(e.retry_after))
+            return
         
-        if not display_name:
+        if not account:
             embed = discord.Embed(
                 title="❌ Admin Verification Failed",
                 description=f"Could not find Roblox user: `{roblox_username}`",
@@ -170,32 +292,25 @@ class VerificationCommands(commands.Cog):
             await message.edit(embed=embed)
             return
         
-        # Update Discord nickname
-        try:
-            await discord_user.edit(nick=display_name)
-            nickname_updated = True
-        except discord.Forbidden:
-            nickname_updated = False
+        display_name = account['displayName']
+        roblox_username = account['name']
         
-        # Store verification data
+        # Store verification data (admins may verify an account that is already claimed)
         guild_id = str(ctx.guild.id)
         user_id = str(discord_user.id)
+        claimed_by = self.other_claims(account['id'], guild_id, user_id)
         
-        if guild_id not in self.bot.verification_data:
-            self.bot.verification_data[guild_id] = {}
-        
-        self.bot.verification_data[guild_id][user_id] = {
+        self.bot.save_verification(guild_id, user_id, {
+            'roblox_id': account['id'],
             'roblox_username': roblox_username,
             'display_name': display_name,
             'verified_at': discord.utils.utcnow().isoformat(),
+            'last_checked': discord.utils.utcnow().timestamp(),
             'discord_user': discord_user.name,
             'verified_by_admin': ctx.author.name
-        }
-        
-        # Handle role assignment
-        await self.bot.handle_role_assignment(discord_user, display_name, guild_id)
+        })
         
-        # Create success embed
+        # Reply now; the member edit runs on the job queue and fills in the embed
         embed = discord.Embed(
             title="✅ Admin Verification Successful",
             color=0x00ff00
@@ -204,14 +319,82 @@ class VerificationCommands(commands.Cog):
         embed.add_field(name="Display Name", value=display_name, inline=True)
         embed.add_field(name="Discord User", value=discord_user.mention, inline=True)
         embed.add_field(name="Verified by Admin", value=ctx.author.mention, inline=True)
+        embed.add_field(name="Nickname Updated", value=PENDING, inline=True)
+        if claimed_by:
+            embed.add_field(name="⚠️ Also Verified By", value=self.mention_users(claimed_by), inline=False)
         
-        if nickname_updated:
-            embed.add_field(name="Nickname Updated", value="✅ Yes", inline=True)
-        else:
-            embed.add_field(name="Nickname Updated", value="❌ No (Missing permissions)", inline=True)
+        await message.edit(embed=embed)
+        
+        member_job = await self.bot.verification_jobs.submit(
+            lambda: self.bot.apply_verification(discord_user, display_name, guild_id)
+        )
+        nickname_text, _ = await self.member_job_result(member_job, discord_user)
+        embed.set_field_at(4, name="Nickname Updated", value=nickname_text, inline=True)
         
         await message.edit(embed=embed)
     
+    @commands.command(name='whoverified')
+    @commands.has_permissions(manage_guild=True)
+    async def who_verified(self, ctx, roblox: str):
+        """Show which members are verified as a Roblox account (username or ID)"""
+        guild_id = str(ctx.guild.id)
+        claims = self.bot.verification_index.claims(roblox, guild_id)
+        
+        if not claims:
+            await ctx.send(f"❌ Nobody in this server is verified as `{roblox}`.")
+            return
+        
+        verified_users = self.bot.verification_data.get(guild_id, {})
+        lines = []
+        for _, user_id in sorted(claims):
+            data = verified_users.get(user_id, {})
+            admin_note = f" (by {data['verified_by_admin']})" if data.get('verified_by_admin') else ""
+            lines.append(f"• <@{user_id}> → `{data.get('roblox_username', roblox)}`{admin_note}")
+        
+        embed = discord.Embed(
+            title=f"🔎 Verified as {roblox}",
+            description="\n".join(lines[:20]) + (f"\n… and {len(lines) - 20} more" if len(lines) > 20 else ""),
+            color=0x7289da
+        )
+        roblox_id = verified_users.get(min(claims)[1], {}).get('roblox_id')
+        if roblox_id is not None:
+            embed.set_footer(text=f"Roblox ID {roblox_id} • verified in {self.bot.verification_index.guild_count(roblox_id)} server(s)")
+        
+        await ctx.send(embed=embed)
+    
+    @commands.command(name='unverify')
+    async def unverify(self, ctx, member: discord.Member = None):
+        """Remove your Roblox verification (admins can remove another member's)"""
+        if member is not None and member != ctx.author and not ctx.author.guild_permissions.manage_guild:
+            await ctx.send("❌ You need the Manage Server permission to unverify other members.")
+            return
+        member = member or ctx.author
+        
+        user_data = self.bot.remove_verification(str(ctx.guild.id), str(member.id))
+        if user_data is None:
+            await ctx.send(f"❌ {member.mention} is not verified.")
+            return
+        
+        await ctx.send(f"✅ Removed verification of `{user_data.get('roblox_username', 'unknown')}` for {member.mention}. Nickname and roles were left unchanged.")
+    
+    @commands.command(name='setuniqueaccounts')
+    @commands.has_permissions(manage_guild=True)
+    async def set_unique_accounts(self, ctx, enabled: bool):
+        """Allow each Roblox account to be verified by only one member (on/off)"""
+        guild_id = str(ctx.guild.id)
+        if guild_id not in self.bot.guild_configs:
+            self.bot.guild_configs[guild_id] = {}
+        
+        self.bot.guild_configs[guild_id].setdefault('verification', {})['unique_accounts'] = enabled
+        # Save configuration immediately
+        self.bot.mark_dirty("guild_configs", guild_id)
+        await self.bot.save_data("guild_configs")
+        
+        if enabled:
+            await ctx.send("✅ Each Roblox account can now be verified by only one member. Admins can still use `!adminverify`.")
+        else:
+            await ctx.send("✅ Members can now verify Roblox accounts that are already verified by someone else.")
+    
     @commands.command(name='verificationstatus')
     @commands.has_permissions(manage_guild=True)
     async def verification_status(self, ctx):
@@ -228,9 +411,14 @@ class VerificationCommands(commands.Cog):
         )
         
         # Configuration info
-        embed.add_field(name="Keyword", value=f"`{keyword_config.get('keyword', 'OG')}`", inline=True)
-        embed.add_field(name="Role", value=keyword_config.get('role_name', 'OG member'), inline=True)
+        rules = keyword_rules(keyword_config)
+        keywords = ", ".join(f"`{describe_rule(rule)}`" for rule in rules[:5]) or "None"
+        if len(rules) > 5:
+            keywords += f" (+{len(rules) - 5} more)"
+        embed.add_field(name="Keywords", value=keywords, inline=True)
+        embed.add_field(name="Keyword Rules", value=str(len(rules)), inline=True)
         embed.add_field(name="Verified Users", value=str(len(verified_users)), inline=True)
+        embed.add_field(name="Unique Accounts", value="On" if self.unique_accounts(guild_id) else "Off", inline=True)
         
         # Show some verified users
         if verified_users:
@@ -246,6 +434,20 @@ class VerificationCommands(commands.Cog):
             if len(verified_users) > 5:
                 embed.set_footer(text=f"Showing 5 of {len(verified_users)} verified users")
         
+        breaker = self.bot.roblox.breaker
+        embed.add_field(name="Roblox API", value=f"Circuit {breaker.state} ({breaker.failures} recent failures)", inline=False)
+        
+        # Roblox lookup cache health
+        stats = self.bot.roblox_cache.stats
+        embed.add_field(
+            name="Roblox Lookup Cache",
+            value=(
+                f"{stats['hits']} hits • {stats['misses']} misses • {stats['coalesced']} coalesced\n"
+                f"Hit rate: {stats['hit_rate']:.1%} • {stats['size']} cached"
+            ),
+            inline=False
+        )
+        
         await ctx.send(embed=embed)
 
 async def setup(bot):
@@ -1,12 +1,27 @@
 import discord
 from discord.ext import commands, tasks
-import json
 import os
 import asyncio
-import aiohttp
+import time
 from datetime import datetime, timedelta
 import logging
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
+from utils.storage import DataStore, peek, resident_items
+from utils.journal import AppendLog, WarningJournal, XPJournal
+from utils.levels import XPTable
+from utils.warning_log import WarningLog, merge_legacy_file
+from utils.guild_config import CompiledGuildConfig
+from utils.ranking import RankIndex
+from utils.roblox import RobloxClient
+from utils.ratelimit import TokenBucket, parse_retry_after
+from utils.workers import WorkerPool
+from utils.cache import TTLCache
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.member_updates import MemberUpdate
+from utils.jobs import JobQueue
+from utils.outbox import Outbox
+from utils.keyword_roles import KeywordRoleMatcher, keyword_rules
+from utils.verification import RecheckScheduler, VerificationIndex, initial_due, next_check_interval
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -29,195 +44,635 @@ class XLZRBot(commands.Bot):
         self.data_dir = "data"
         self.ensure_data_directory()
         
+        # Compiled per-guild configs for the event handlers
+        self.compiled_configs: Dict[str, CompiledGuildConfig] = {}
+        self.keyword_matchers: Dict[str, KeywordRoleMatcher] = {}
+        
+        # Leaderboard order per guild, built on first use and kept up to date by on_message
+        self.rank_indexes: Dict[str, RankIndex] = {}
+        
         # Load configurations
-        self.guild_configs = self.load_json("guild_configs.json", {})
-        self.user_levels = self.load_json("user_levels.json", {})
-        self.user_warnings = self.load_json("user_warnings.json", {})
-        self.verification_data = self.load_json("verification_data.json", {})
-        self.keyword_config = self.load_json("keyword_config.json", {
+        self.storage = DataStore(self, self.data_dir, backend=os.getenv('STORAGE_BACKEND', 'json').lower())
+        self.guild_configs = self.storage.register("guild_configs", "guild_configs.json", {})
+        self.user_levels = self.storage.register(
+            "user_levels", "user_levels.json", {}, per_user=True, sharded=True, guild_factory=XPTable
+        )
+        self.user_warnings = self.storage.register(
+            "user_warnings", "user_warnings.json", {}, per_user=True, sharded=True, guild_factory=WarningLog
+        )
+        self.verification_data = self.storage.register("verification_data", "verification_data.json", {}, per_user=True)
+        self.keyword_config = self.storage.register("keyword_config", "keyword_config.json", {
             "keyword": "OG",
             "role_name": "OG member"
         })
         
-        # Auto-save task
+        # Roblox account -> verified Discord users, for !whoverified and duplicate-claim checks
+        self.verification_index = VerificationIndex.build(self.verification_data)
+        
+        # Replay XP changes journalled since the last save
+        self.xp_journal = XPJournal(os.path.join(self.data_dir, "journal"))
+        replayed = self.xp_journal.replay_into(self.user_levels, XPTable)
+        for guild_id, user_id in replayed:
+            self.mark_dirty("user_levels", guild_id, user_id)
+        if replayed:
+            logger.info(f"Replayed XP journal for {len(replayed)} users")
+        
+        # Warnings are journalled the same way, so !warn only appends a line
+        self.warning_journal = WarningJournal(os.path.join(self.data_dir, "journal"))
+        replayed = self.warning_journal.replay_into(self.user_warnings, WarningLog)
+        for guild_id, user_id in replayed:
+            self.mark_dirty("user_warnings", guild_id, user_id)
+        if replayed:
+            logger.info(f"Replayed warning journal for {len(replayed)} users")
+        
+        # The old moderation cog kept its own warnings file in the working directory
+        for guild_id, user_id in merge_legacy_file("user_warnings.json", self.user_warnings):
+            self.mark_dirty("user_warnings", guild_id, user_id)
+        
+        # From here on sharded guilds are only loaded off the event loop (load_guild_data)
+        self.storage.start()
+        
+        # Journal flush task
+        self.journal_flush.change_interval(seconds=float(os.getenv('JOURNAL_FLUSH_SECONDS', '2')))
+        self.journal_flush.start()
+        
+        # Auto-save task (SQLite only writes changed rows, so it can save far more often)
+        default_interval = '15' if self.storage.backend == 'sqlite' else '300'
+        self.auto_save.change_interval(seconds=int(os.getenv('SAVE_INTERVAL_SECONDS', default_interval)))
         self.auto_save.start()
         
-        # Daily verification check
+        # Unload guilds that have gone idle (levels and warnings are loaded per guild on demand)
+        self.guild_idle_seconds = float(os.getenv('GUILD_IDLE_MINUTES', '30')) * 60
+        self.guild_cache_max_users = int(os.getenv('GUILD_CACHE_MAX_USERS', '0'))
+        self.evict_idle_guilds.start()
+        
+        # Expire warnings past their server's expiry (each loaded server keeps a heap of expiry times)
+        self.expire_warnings.start()
+        
+        # Request budgets for the Roblox API and for Discord member edits
+        self.roblox_limiter = TokenBucket(float(os.getenv('ROBLOX_REQUESTS_PER_SECOND', '5')))
+        self.discord_limiter = TokenBucket(float(os.getenv('DISCORD_REQUESTS_PER_SECOND', '5')))
+        self.verification_concurrency = int(os.getenv('VERIFICATION_CONCURRENCY', '8'))
+        self.moderation_concurrency = int(os.getenv('MODERATION_CONCURRENCY', '4'))
+        
+        # Log/announcement embeds are queued per channel and sent up to 10 per message
+        self.outbox = Outbox(self.discord_request, flush_delay=float(os.getenv('OUTBOX_FLUSH_SECONDS', '0.5')))
+        
+        # Username -> account lookups, shared by !verify/!adminverify bursts
+        self.roblox_cache = TTLCache(
+            max_size=int(os.getenv('ROBLOX_CACHE_SIZE', '1024')),
+            ttl=float(os.getenv('ROBLOX_CACHE_TTL_SECONDS', '300')),
+            negative_ttl=float(os.getenv('ROBLOX_CACHE_NEGATIVE_TTL_SECONDS', '60'))
+        )
+        
+        # Shared Roblox API client (its HTTP session is opened in setup_hook)
+        self.roblox = RobloxClient(
+            max_connections=int(os.getenv('ROBLOX_MAX_CONNECTIONS', '20')),
+            timeout=float(os.getenv('ROBLOX_TIMEOUT_SECONDS', '10')),
+            limiter=self.roblox_limiter,
+            breaker=CircuitBreaker(
+                "Roblox API",
+                failure_threshold=int(os.getenv('ROBLOX_BREAKER_FAILURES', '5')),
+                cooldown=float(os.getenv('ROBLOX_BREAKER_COOLDOWN_SECONDS', '60'))
+            )
+        )
+        
+        # Rolling verification check: every few minutes, recheck the users that are due.
+        # Users start on a daily interval that doubles (up to a cap) while their name stays the same.
+        self.verification_slices = max(1, int(os.getenv('VERIFICATION_SLICES', '288')))
+        slice_minutes = float(os.getenv('VERIFICATION_SLICE_MINUTES', '5'))
+        self.verification_base_interval = self.verification_slices * slice_minutes * 60
+        self.verification_max_interval = max(
+            self.verification_base_interval,
+            float(os.getenv('VERIFICATION_MAX_INTERVAL_HOURS', '168')) * 3600
+        )
+        self.verification_max_per_run = int(os.getenv('VERIFICATION_MAX_PER_RUN', '500'))
+        self.verification_scheduler: Optional[RecheckScheduler] = None
+        
+        # Nickname/role edits and tutorial messages after !verify run here, so the reply does not wait on them
+        self.verification_jobs = JobQueue(
+            "Verification jobs",
+            workers=int(os.getenv('VERIFICATION_JOB_WORKERS', '4')),
+            max_size=int(os.getenv('VERIFICATION_JOB_QUEUE_SIZE', '100')),
+            max_retries=int(os.getenv('VERIFICATION_JOB_RETRIES', '3'))
+        )
+        self.daily_verification_check.change_interval(minutes=slice_minutes)
         self.daily_verification_check.start()
     
+    async def setup_hook(self):
+        """Open long-lived resources once the event loop is running"""
+        await self.roblox.start()
+    
     def ensure_data_directory(self):
         """Ensure data directory exists"""
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
     
-    def load_json(self, filename: str, default: Any = None) -> Any:
-        """Load JSON data from file"""
-        filepath = os.path.join(self.data_dir, filename)
+    def mark_dirty(self, store: str, guild_id: Optional[str] = None, user_id: Optional[str] = None):
+        """Flag a data store (or one guild/user of it) as changed so the next save writes it"""
+        self.storage.mark_dirty(store, guild_id, user_id)
+        
+        # Every config change goes through here, so it doubles as cache invalidation
+        if store == "guild_configs":
+            if guild_id is None:
+                self.compiled_configs.clear()
+            else:
+                self.compiled_configs.pop(guild_id, None)
+        elif store == "keyword_config":
+            if guild_id is None:
+                self.keyword_matchers.clear()
+            else:
+                self.keyword_matchers.pop(guild_id, None)
+    
+    def get_guild_config(self, guild_id: str) -> CompiledGuildConfig:
+        """Compiled config for a guild, rebuilt only after the config changes"""
+        config = self.compiled_configs.get(guild_id)
+        if config is None:
+            config = CompiledGuildConfig(self.guild_configs.get(guild_id, {}))
+            self.compiled_configs[guild_id] = config
+        return config
+    
+    def get_keyword_matcher(self, guild_id: str) -> KeywordRoleMatcher:
+        """Compiled keyword → role rules for a guild, rebuilt only after the rules change"""
+        matcher = self.keyword_matchers.get(guild_id)
+        if matcher is None:
+            matcher = KeywordRoleMatcher(keyword_rules(self.keyword_config.get(guild_id, self.keyword_config)))
+            self.keyword_matchers[guild_id] = matcher
+        return matcher
+    
+    def get_rank_index(self, guild_id: str) -> Optional[RankIndex]:
+        """Leaderboard index for a loaded guild, built the first time it is needed"""
+        table = self.user_levels.get(guild_id)
+        if table is None:
+            return None
+        index = self.rank_indexes.get(guild_id)
+        # A guild that was evicted and reloaded gets a new table, so re-index it
+        if index is None or index.table is not table:
+            index = RankIndex(table)
+            self.rank_indexes[guild_id] = index
+        return index
+    
+    async def save_data(self, *stores: str):
+        """Write changed stores now instead of waiting for the next auto-save"""
+        await self.storage.flush(*stores)
+    
+    async def load_guild_data(self, store: str, guild_id: str):
+        """Make sure a guild's data for a sharded store is in memory before using it"""
+        await self.storage.ensure_loaded(store, guild_id)
+    
+    async def add_warning(self, guild_id: str, user_id: str, warning: Dict[str, Any]) -> Dict[str, Any]:
+        """Append a warning to a guild's log and journal it; returns it with its ID set
+        
+        The warning gets an ``expires_at`` time when the server has warning
+        expiry configured.
+        """
+        added = await self.add_warnings(guild_id, [(user_id, warning)], flush=False)
+        return added[0]
+    
+    async def add_warnings(
+        self,
+        guild_id: str,
+        entries: List[Tuple[str, Dict[str, Any]]],
+        flush: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Append a batch of ``(user_id, warning)`` to a guild's log
+        
+        With ``flush`` the whole batch is written to the journal in one go
+        instead of waiting for the next journal flush.
+        """
+        await self.load_guild_data("user_warnings", guild_id)
+        if guild_id not in self.user_warnings:
+            self.user_warnings[guild_id] = WarningLog()
+        log = self.user_warnings[guild_id]
+        
+        lifetime = self.warning_lifetime(guild_id)
+        added = []
+        for user_id, warning in entries:
+            if lifetime is not None:
+                warning['expires_at'] = time.time() + lifetime
+            warning = log.add(user_id, warning)
+            self.warning_journal.record(guild_id, user_id, warning)
+            self.mark_dirty("user_warnings", guild_id, user_id)
+            added.append(warning)
+        
+        if flush:
+            await self.warning_journal.flush()
+        return added
+    
+    def warning_lifetime(self, guild_id: str) -> Optional[float]:
+        """Seconds a warning stays active in a guild, or None if warnings never expire"""
+        days = self.guild_configs.get(guild_id, {}).get('warnings', {}).get('expire_days')
+        return days * 86400 if days else None
+    
+    async def guild_warnings(self, guild_id: str) -> Optional[WarningLog]:
+        """A guild's warning log with due warnings marked expired, or None if it has no warnings"""
+        await self.load_guild_data("user_warnings", guild_id)
+        log = self.user_warnings.get(guild_id)
+        if log is not None:
+            self.expire_guild_warnings(guild_id, log, time.time())
+        return log
+    
+    async def active_warnings(self, guild_id: str, user_id: str) -> int:
+        """Number of unexpired warnings a user has"""
+        log = await self.guild_warnings(guild_id)
+        return log.count(user_id) if log is not None else 0
+    
+    def expire_guild_warnings(self, guild_id: str, log: WarningLog, now: float) -> int:
+        expired = log.expire(now)
+        for user_id, _ in expired:
+            self.mark_dirty("user_warnings", guild_id, user_id)
+        return len(expired)
+    
+    @property
+    def journals(self) -> List[Tuple[AppendLog, str]]:
+        """Each write-ahead journal with the store it is compacted into"""
+        return [(self.xp_journal, "user_levels"), (self.warning_journal, "user_warnings")]
+    
+    async def save_all(self):
+        """Save every changed store and compact the journals into the new snapshot"""
+        sealed = []
+        for journal, store in self.journals:
+            sealed.append((journal, store, self.storage.stores[store].dirty, journal.rotate()))
+        saved = await self.storage.flush()
+        
+        # Everything up to a sealed segment is now part of its store on disk
+        for journal, store, was_dirty, seq in sealed:
+            if store in saved or not was_dirty:
+                await journal.discard_through(seq)
+        return saved
+    
+    @tasks.loop(seconds=2)
+    async def journal_flush(self):
+        """Write buffered XP and warning journal records to disk"""
+        for journal, _ in self.journals:
+            try:
+                await journal.flush()
+            except Exception as e:
+                logger.error(f"Error flushing {journal.name} journal: {e}")
+    
+    @tasks.loop(minutes=1)
+    async def evict_idle_guilds(self):
+        """Write back and unload guilds that are idle or over the memory budget"""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return default if default is not None else {}
+            evicted = await self.storage.evict_idle(self.guild_idle_seconds, self.guild_cache_max_users)
+            if evicted:
+                logger.info(f"Evicted {evicted} idle guild(s) from memory")
+            
+            # Drop leaderboard indexes whose XP table is no longer in memory
+            for guild_id, index in list(self.rank_indexes.items()):
+                if peek(self.user_levels, guild_id) is not index.table:
+                    del self.rank_indexes[guild_id]
+        except Exception as e:
+            logger.error(f"Error evicting idle guilds: {e}")
     
-    def save_json(self, filename: str, data: Any):
-        """Save JSON data to file"""
-        filepath = os.path.join(self.data_dir, filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    @tasks.loop(minutes=1)
+    async def expire_warnings(self):
+        """Mark due warnings as expired in the servers that are loaded
+        
+        Servers that are not loaded catch up the next time their warnings are read.
+        """
+        try:
+            now = time.time()
+            expired = 0
+            for guild_id, log in resident_items(self.user_warnings):
+                next_expiry = log.next_expiry()
+                if next_expiry is not None and next_expiry <= now:
+                    expired += self.expire_guild_warnings(guild_id, log, now)
+            if expired:
+                logger.info(f"Expired {expired} warning(s)")
+        except Exception as e:
+            logger.error(f"Error expiring warnings: {e}")
     
     @tasks.loop(minutes=5)
     async def auto_save(self):
-        """Auto-save all data every 5 minutes"""
+        """Auto-save changed data (every 5 minutes by default)"""
         try:
-            self.save_json("guild_configs.json", self.guild_configs)
-            self.save_json("user_levels.json", self.user_levels)
-            self.save_json("user_warnings.json", self.user_warnings)
-            self.save_json("verification_data.json", self.verification_data)
-            self.save_json("keyword_config.json", self.keyword_config)
-            logger.info("Auto-saved all data")
+            saved = await self.save_all()
+            if saved:
+                logger.info(f"Auto-saved {', '.join(saved)}")
         except Exception as e:
             logger.error(f"Error during auto-save: {e}")
     
-    @tasks.loop(hours=24)
+    @tasks.loop(minutes=5)
     async def daily_verification_check(self):
-        """Daily check for verified users' Roblox display names"""
-        logger.info("Starting daily verification check...")
+        """Recheck the verified users whose next check is due
         
-        for guild_id, users in self.verification_data.items():
-            guild = self.get_guild(int(guild_id))
-            if not guild:
-                continue
-                
-            for user_id, user_data in users.items():
-                try:
-                    member = guild.get_member(int(user_id))
-                    if not member:
-                        continue
-                    
-                    # Fetch current Roblox display name
-                    current_display_name = await self.get_roblox_display_name(user_data['roblox_username'])
-                    
-                    if current_display_name and current_display_name != user_data.get('display_name'):
-                        # Update stored display name
-                        user_data['display_name'] = current_display_name
-                        
-                        # Update Discord nickname
-                        try:
-                            await member.edit(nick=current_display_name)
-                        except discord.Forbidden:
-                            logger.warning(f"Cannot change nickname for {member.name}")
-                        
-                        # Check keyword and role assignment
-                        await self.handle_role_assignment(member, current_display_name, guild_id)
-                        
-                        logger.info(f"Updated verification for {member.name}: {current_display_name}")
-                
-                except Exception as e:
-                    logger.error(f"Error checking verification for user {user_id}: {e}")
-    
-    async def get_roblox_display_name(self, username: str) -> Optional[str]:
-        """Fetch Roblox display name from username using Roblox API"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                # First, get user ID from username
-                async with session.post(
-                    "https://users.roblox.com/v1/usernames/users",
-                    json={"usernames": [username]}
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get("data") and len(data["data"]) > 0:
-                            user_id = data["data"][0]["id"]
-                            
-                            # Then get user details including display name
-                            async with session.get(f"https://users.roblox.com/v1/users/{user_id}") as user_response:
-                                if user_response.status == 200:
-                                    user_data = await user_response.json()
-                                    return user_data.get("displayName")
-            return None
-        except Exception as e:
-            logger.error(f"Error fetching Roblox data for {username}: {e}")
-            return None
-    
-    async def handle_role_assignment(self, member: discord.Member, display_name: str, guild_id: str):
-        """Handle role assignment based on keyword in display name"""
-        guild_config = self.keyword_config.get(guild_id, self.keyword_config)
-        keyword = guild_config.get("keyword", "OG")
-        role_name = guild_config.get("role_name", "OG member")
-        role_id = guild_config.get("role_id")
+        Due times come from each user's stored ``last_checked`` and
+        ``check_interval``, so a restart carries on where it left off.
+        """
+        # Roblox is failing: leave everyone queued until the circuit lets a probe through
+        if self.roblox.breaker.is_open:
+            return
         
-        role = None
-        if role_id:
-            role = member.guild.get_role(role_id)
+        if self.verification_scheduler is None:
+            self.verification_scheduler = RecheckScheduler()
+            for guild_id, users in self.verification_data.items():
+                for user_id in users:
+                    self.schedule_verification(guild_id, user_id)
         
-        if not role:
-            role = discord.utils.get(member.guild.roles, name=role_name)
+        now = time.time()
+        due = self.verification_scheduler.pop_due(now, self.verification_max_per_run)
         
-        if not role:
+        references = []
+        for guild_id, user_id in due:
+            user_data = self.verification_data.get(guild_id, {}).get(user_id)
+            if user_data is None:
+                continue  # No longer verified
+            guild = self.get_guild(int(guild_id))
+            member = guild.get_member(int(user_id)) if guild else None
+            if member:
+                references.append((guild_id, user_id, member, user_data))
+            else:
+                # Not in the server right now; look again after a normal interval
+                self.verification_scheduler.schedule(guild_id, user_id, now + self.verification_base_interval)
+        
+        if not references:
             return
         
-        has_keyword = keyword.lower() in display_name.lower()
-        has_role = role in member.roles
+        updated = await self.check_verified_members(references)
+        for guild_id, user_id, member, user_data in references:
+            if user_data.get('last_checked', 0) >= now:
+                self.schedule_verification(guild_id, user_id)
+            elif self.roblox.breaker.is_open:
+                # Roblox went down mid-run; retry once the circuit is due to close
+                self.verification_scheduler.schedule(guild_id, user_id, now + self.roblox.breaker.retry_after)
+            else:
+                # Lookup failed or the account is gone; retry later rather than on every run
+                self.verification_scheduler.schedule(guild_id, user_id, now + self.verification_base_interval / 4)
+        
+        logger.info(
+            f"Verification check: {len(references)} members checked, {updated} updated, "
+            f"{len(self.verification_scheduler)} scheduled"
+        )
+    
+    @daily_verification_check.before_loop
+    async def before_verification_check(self):
+        await self.wait_until_ready()
+    
+    def schedule_verification(self, guild_id: str, user_id: str):
+        """(Re)queue a verified user for their next check"""
+        if self.verification_scheduler is None:
+            return  # Built from verification_data on the first run
+        user_data = self.verification_data.get(guild_id, {}).get(user_id)
+        if user_data is None:
+            self.verification_scheduler.remove(guild_id, user_id)
+            return
+        
+        last_checked = user_data.get('last_checked')
+        if last_checked is None:
+            due = initial_due(user_id, time.time(), self.verification_base_interval, self.verification_slices)
+        else:
+            due = last_checked + user_data.get('check_interval', self.verification_base_interval)
+        self.verification_scheduler.schedule(guild_id, user_id, due)
+    
+    def save_verification(self, guild_id: str, user_id: str, user_data: Dict[str, Any]):
+        """Store a new verification record, index it and queue its first recheck"""
+        self.verification_data.setdefault(guild_id, {})[user_id] = user_data
+        self.mark_dirty("verification_data", guild_id, user_id)
+        self.verification_index.add(guild_id, user_id, user_data)
+        self.schedule_verification(guild_id, user_id)
+    
+    def remove_verification(self, guild_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Delete a verification record; returns it, or None if the user was not verified"""
+        user_data = self.verification_data.get(guild_id, {}).pop(user_id, None)
+        if user_data is None:
+            return None
+        self.mark_dirty("verification_data", guild_id, user_id)
+        self.verification_index.remove(guild_id, user_id)
+        if self.verification_scheduler is not None:
+            self.verification_scheduler.remove(guild_id, user_id)
+        return user_data
+    
+    async def check_verified_members(self, references: List[tuple]) -> int:
+        """Look up the Roblox accounts of ``(guild_id, user_id, member, user_data)`` entries and apply changes
+        
+        Returns how many members had a new display name.
+        """
+        # Group verified members by Roblox account so each account is looked up once
+        by_id: Dict[int, List[tuple]] = {}
+        by_username: Dict[str, List[tuple]] = {}
+        for reference in references:
+            user_data = reference[3]
+            if user_data.get('roblox_id'):
+                by_id.setdefault(int(user_data['roblox_id']), []).append(reference)
+            elif user_data.get('roblox_username'):
+                # Verified before IDs were stored; resolved by name once, then migrated
+                by_username.setdefault(user_data['roblox_username'].lower(), []).append(reference)
+        
+        if not by_id and not by_username:
+            return 0
         
         try:
-            if has_keyword and not has_role:
-                await member.add_roles(role)
-                logger.info(f"Added {role_name} role to {member.name}")
-            elif not has_keyword and has_role:
-                await member.remove_roles(role)
-                logger.info(f"Removed {role_name} role from {member.name}")
-        except discord.Forbidden:
+            accounts = await self.roblox.get_users(by_id) if by_id else {}
+            if by_username:
+                resolved = await self.roblox.resolve_usernames(by_username)
+                for username, references in by_username.items():
+                    account = resolved.get(username)
+                    if account:
+                        accounts[account['id']] = account
+                        by_id.setdefault(account['id'], []).extend(references)
+        except Exception as e:
+            logger.error(f"Error resolving Roblox accounts: {e}")
+            return 0
+        
+        updates = []
+        for roblox_id, references in by_id.items():
+            account = accounts.get(roblox_id)
+            if not account or not account.get('displayName'):
+                continue
+            # Fresh data for free: let later !verify lookups of this name use it
+            self.roblox_cache.put(account['name'].lower(), account)
+            for reference in references:
+                updates.append(reference + (account,))
+        
+        updated = 0
+        checked_at = time.time()
+        
+        async def apply(update):
+            nonlocal updated
+            guild_id, user_id, member, user_data, account = update
+            # Skip entries replaced by a re-verification while the lookup ran
+            if self.verification_data.get(guild_id, {}).get(user_id) is not user_data:
+                return
+            user_data['last_checked'] = checked_at
+            self.mark_dirty("verification_data", guild_id, user_id)
+            try:
+                changed = await self.update_verified_member(member, guild_id, user_id, user_data, account)
+                user_data['check_interval'] = next_check_interval(
+                    user_data.get('check_interval', self.verification_base_interval),
+                    changed,
+                    self.verification_base_interval,
+                    self.verification_max_interval
+                )
+                if changed:
+                    updated += 1
+            except Exception as e:
+                logger.error(f"Error checking verification for user {user_id}: {e}")
+        
+        # Nickname and role edits run concurrently, paced by the Discord limiter
+        pool = WorkerPool("Verification check", self.verification_concurrency)
+        await pool.run(updates, apply)
+        return updated
+    
+    async def discord_request(self, func, *args, **kwargs):
+        """Call a Discord API coroutine under the Discord limiter, waiting out 429s"""
+        for attempt in range(3):
+            await self.discord_limiter.acquire()
+            try:
+                return await func(*args, **kwargs)
+            except discord.RateLimited as e:
+                if attempt == 2:
+                    raise
+                retry_after = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt == 2:
+                    raise
+                retry_after = parse_retry_after(e.response.headers.get('Retry-After'))
+            logger.warning(f"Discord rate limited, retrying in {retry_after:.1f}s")
+            self.discord_limiter.pause(retry_after)
+    
+    async def update_verified_member(
+        self,
+        member: discord.Member,
+        guild_id: str,
+        user_id: str,
+        user_data: Dict[str, Any],
+        account: Dict[str, Any]
+    ) -> bool:
+        """Apply a looked-up Roblox account to a verified member; returns True if the display name changed"""
+        # Keep the stored ID and username current (also migrates entries saved without an ID)
+        if user_data.get('roblox_id') != account['id'] or user_data.get('roblox_username') != account['name']:
+            user_data['roblox_id'] = account['id']
+            user_data['roblox_username'] = account['name']
+            self.mark_dirty("verification_data", guild_id, user_id)
+            self.verification_index.add(guild_id, user_id, user_data)
+        
+        current_display_name = account['displayName']
+        if current_display_name == user_data.get('display_name'):
+            return False
+        
+        # Update stored display name
+        user_data['display_name'] = current_display_name
+        self.mark_dirty("verification_data", guild_id, user_id)
+        
+        # Update Discord nickname and keyword role in one edit
+        await self.apply_verification(member, current_display_name, guild_id)
+        
+        logger.info(f"Updated verification for {member.name}: {current_display_name}")
+        return True
+    
+    async def get_roblox_user(self, username: str) -> Optional[Dict[str, Any]]:
+        """Look up a Roblox account (id, name, displayName) by username
+        
+        Results are cached, and concurrent lookups of the same name share one
+        request. Raises ``CircuitOpenError`` while the Roblox API is failing.
+        """
+        try:
+            return await self.roblox_cache.get_or_load(
+                username.lower(),
+                lambda: self.roblox.get_user_by_username(username)
+            )
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching Roblox data for {username}: {e}")
+            return None
+    
+    async def apply_verification(self, member: discord.Member, display_name: str, guild_id: str) -> Tuple[bool, bool]:
+        """Set a verified member's nickname and keyword role with at most one member edit
+        
+        Returns whether the nickname and the roles could be applied.
+        """
+        update = MemberUpdate(member)
+        update.set_nick(display_name)
+        self.plan_role_assignment(update, display_name, guild_id)
+        
+        nick_ok, roles_ok = await update.apply(self.discord_request)
+        if not nick_ok:
+            logger.warning(f"Cannot change nickname for {member.name}")
+        if not roles_ok:
             logger.warning(f"Cannot manage roles for {member.name}")
+        else:
+            for role in update.added:
+                logger.info(f"Added {role.name} role to {member.name}")
+            for role in update.removed:
+                logger.info(f"Removed {role.name} role from {member.name}")
+        return nick_ok, roles_ok
+    
+    def plan_role_assignment(self, update: MemberUpdate, display_name: str, guild_id: str):
+        """Add the roles whose keywords match the display name to ``update`` and remove the rest"""
+        wanted, unwanted = self.get_keyword_matcher(guild_id).plan(update.member.guild, display_name)
+        for role in wanted:
+            update.add_role(role)
+        for role in unwanted:
+            update.remove_role(role)
     
     async def on_ready(self):
         """Bot ready event"""
         logger.info(f'{self.user} has connected to Discord!')
         logger.info(f'Bot is in {len(self.guilds)} guilds')
         
-        # Ensure auto-save task is running
+        # Ensure journal flush and auto-save tasks are running
+        if not self.journal_flush.is_running():
+            self.journal_flush.start()
+        
         if not self.auto_save.is_running():
             self.auto_save.start()
         
+        if not self.evict_idle_guilds.is_running():
+            self.evict_idle_guilds.start()
+        
+        if not self.expire_warnings.is_running():
+            self.expire_warnings.start()
+        
         # Ensure daily check is running
         if not self.daily_verification_check.is_running():
             self.daily_verification_check.start()
     
+    async def close(self):
+        """Save pending changes before shutting down"""
+        try:
+            for journal, _ in self.journals:
+                await journal.flush()
+            await self.save_all()
+            self.storage.close()
+        except Exception as e:
+            logger.error(f"Error saving data on shutdown: {e}")
+        await self.verification_jobs.close()
+        await self.outbox.close()
+        await self.roblox.close()
+        await super().close()
+    
     async def on_member_join(self, member):
         """Handle member join events for welcome messages"""
-        guild_id = str(member.guild.id)
-        config = self.guild_configs.get(guild_id, {}).get('welcome', {})
+        config = self.get_guild_config(str(member.guild.id)).welcome
         
-        if not config.get('enabled', False):
+        if not config.enabled or not config.channel_id:
             return
         
-        channel_id = config.get('channel_id')
-        if not channel_id:
-            return
-        
-        channel = member.guild.get_channel(channel_id)
+        channel = member.guild.get_channel(config.channel_id)
         if not channel:
             return
         
         # Create welcome embed
         embed = discord.Embed(
             title="Welcome!",
-            description=config.get('message', 'Welcome {mention} to {server}!').format(
+            description=config.template.render(
                 mention=member.mention,
                 user=member.name,
                 server=member.guild.name
             ),
-            color=int(config.get('color', '0x7289da').replace('#', '0x'), 16)
+            color=config.color
         )
         
         # Add thumbnail
-        thumbnail_type = config.get('thumbnail', 'avatar')
-        if thumbnail_type == 'avatar':
+        if config.thumbnail == 'avatar':
             embed.set_thumbnail(url=member.display_avatar.url)
-        elif thumbnail_type == 'server':
+        elif config.thumbnail == 'server':
             embed.set_thumbnail(url=member.guild.icon.url if member.guild.icon else None)
         
         # Add GIF if specified
-        gif_url = config.get('gif')
+        gif_url = config.gif
         if gif_url:
             embed.set_image(url=gif_url)
         
@@ -228,24 +683,17 @@ class XLZRBot(commands.Bot):
     
     async def on_member_remove(self, member):
         """Handle member leave events for goodbye messages"""
-        guild_id = str(member.guild.id)
-        config = self.guild_configs.get(guild_id, {}).get('goodbye', {})
-        
-        if not config.get('enabled', False):
-            return
+        config = self.get_guild_config(str(member.guild.id)).goodbye
         
-        channel_id = config.get('channel_id')
-        if not channel_id:
+        if not config.enabled or not config.channel_id:
             return
         
-        channel = member.guild.get_channel(channel_id)
+        channel = member.guild.get_channel(config.channel_id)
         if not channel:
             return
         
-        message_text = config.get('message', 'Goodbye {user}! Thanks for being part of {server}.')
-        
         # Replace placeholders - use {user} instead of {mention} for goodbye messages
-        formatted_message = message_text.format(
+        formatted_message = config.template.render(
             user=member.name,
             mention=f"**{member.name}**",  # Bold name instead of mention since user left
             server=member.guild.name
@@ -255,18 +703,17 @@ class XLZRBot(commands.Bot):
         embed = discord.Embed(
             title="Goodbye!",
             description=formatted_message,
-            color=int(config.get('color', '0xff0000').replace('#', '0x'), 16)
+            color=config.color
         )
         
         # Add thumbnail
-        thumbnail_type = config.get('thumbnail', 'avatar')
-        if thumbnail_type == 'avatar':
+        if config.thumbnail == 'avatar':
             embed.set_thumbnail(url=member.display_avatar.url)
-        elif thumbnail_type == 'server':
+        elif config.thumbnail == 'server':
             embed.set_thumbnail(url=member.guild.icon.url if member.guild.icon else None)
         
         # Add GIF if specified
-        gif_url = config.get('gif')
+        gif_url = config.gif
         if gif_url:
             embed.set_image(url=gif_url)
         
@@ -282,11 +729,10 @@ class XLZRBot(commands.Bot):
             return
         
         guild_id = str(message.guild.id)
-        command_config = self.guild_configs.get(guild_id, {}).get('command_only', {})
-        command_only_channels = command_config.get('channels', [])
+        guild_config = self.get_guild_config(guild_id)
         
         # Check if message is in a command-only channel
-        if message.channel.id in command_only_channels:
+        if message.channel.id in guild_config.command_only_channels:
             # Check if message starts with bot prefix (is a command)
             if not message.content.startswith(self.command_prefix):
                 try:
@@ -298,10 +744,11 @@ class XLZRBot(commands.Bot):
         
         # XP System (existing code)
         user_id = str(message.author.id)
+        await self.load_guild_data("user_levels", guild_id)
         
         # Initialize user data if not exists
         if guild_id not in self.user_levels:
-            self.user_levels[guild_id] = {}
+            self.user_levels[guild_id] = XPTable()
         
         if user_id not in self.user_levels[guild_id]:
             self.user_levels[guild_id][user_id] = {'xp': 0, 'level': 1, 'last_message': 0}
@@ -319,30 +766,35 @@ class XLZRBot(commands.Bot):
             
             # Check for level up
             required_xp = user_data['level'] * 100
-            if user_data['xp'] >= required_xp:
+            leveled_up = user_data['xp'] >= required_xp
+            if leveled_up:
                 user_data['level'] += 1
                 user_data['xp'] = 0
-                
+            
+            self.mark_dirty("user_levels", guild_id, user_id)
+            self.xp_journal.record(guild_id, user_id, user_data)
+            
+            rank_index = self.rank_indexes.get(guild_id)
+            if rank_index is not None:
+                rank_index.update(user_id, user_data['level'], user_data['xp'])
+            
+            if leveled_up:
                 # Send level up message if enabled
-                config = self.guild_configs.get(guild_id, {}).get('leveling', {})
-                if config.get('enabled', False):
-                    channel_id = config.get('channel_id')
-                    if channel_id:
-                        channel = message.guild.get_channel(channel_id)
+                config = guild_config.leveling
+                if config.enabled:
+                    if config.channel_id:
+                        channel = message.guild.get_channel(config.channel_id)
                         if channel:
                             embed = discord.Embed(
                                 title="Level Up!",
-                                description=config.get('message', 'Congratulations {mention}! You reached level {level}!').format(
+                                description=config.template.render(
                                     mention=message.author.mention,
                                     user=message.author.name,
                                     level=user_data['level']
                                 ),
-                                color=int(config.get('color', '0xffd700').replace('#', '0x'), 16)
+                                color=config.color
                             )
-                            try:
-                                await channel.send(embed=embed)
-                            except discord.Forbidden:
-                                pass
+                            self.outbox.post(channel, embed, Outbox.ANNOUNCEMENT)
         
         await self.process_commands(message)
 
@@ -7,8 +7,26 @@ Creates timestamped backups of all bot data files.
 import os
 import json
 import shutil
+import sqlite3
 from datetime import datetime
 
+DATABASE = 'xlzr.db'  # STORAGE_BACKEND=sqlite
+
+def backup_database(source, destination):
+    """Copy the SQLite database with the online backup API
+    
+    The bot keeps it in WAL mode, so recent writes may only be in the -wal
+    file; a plain file copy could miss them or catch a half-written page.
+    """
+    source_conn = sqlite3.connect(source)
+    destination_conn = sqlite3.connect(destination)
+    try:
+        with destination_conn:
+            source_conn.backup(destination_conn)
+    finally:
+        destination_conn.close()
+        source_conn.close()
+
 def create_backup():
     """Create a timestamped backup of all data files"""
     if not os.path.exists('data'):
@@ -33,6 +51,13 @@ def create_backup():
         'keyword_config.json'
     ]
     
+    # Per-guild shard directories, and XP/warning journals not yet compacted into a save
+    data_dirs = [
+        'user_levels',
+        'user_warnings',
+        'journal'
+    ]
+    
     backed_up_files = 0
     for filename in data_files:
         source = os.path.join('data', filename)
@@ -42,6 +67,19 @@ def create_backup():
             backed_up_files += 1
             print(f"✅ Backed up: {filename}")
     
+    database = os.path.join('data', DATABASE)
+    if os.path.exists(database):
+        backup_database(database, os.path.join(backup_dir, DATABASE))
+        backed_up_files += 1
+        print(f"✅ Backed up: {DATABASE}")
+    
+    for dirname in data_dirs:
+        source = os.path.join('data', dirname)
+        if os.path.isdir(source):
+            shutil.copytree(source, os.path.join(backup_dir, dirname))
+            backed_up_files += 1
+            print(f"✅ Backed up: {dirname}/")
+    
     if backed_up_files > 0:
         print(f"\n🎉 Backup created successfully!")
         print(f"📁 Location: {backup_dir}")
@@ -79,15 +117,35 @@ def restore_backup(backup_name):
     if not os.path.exists('data'):
         os.makedirs('data')
     
+    # Journals only apply on top of the data they were written with
+    journal_dir = os.path.join('data', 'journal')
+    if os.path.isdir(journal_dir):
+        shutil.rmtree(journal_dir)
+    
     # Copy files from backup
     restored_files = 0
     for filename in os.listdir(backup_dir):
-        if filename.endswith('.json'):
+        if filename == DATABASE:
+            destination = os.path.join('data', filename)
+            # A leftover WAL from the old database would be replayed onto the restored one
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(destination + suffix):
+                    os.remove(destination + suffix)
+            shutil.copy2(os.path.join(backup_dir, filename), destination)
+            restored_files += 1
+            print(f"✅ Restored: {filename}")
+        elif filename.endswith('.json'):
             source = os.path.join(backup_dir, filename)
             destination = os.path.join('data', filename)
             shutil.copy2(source, destination)
             restored_files += 1
             print(f"✅ Restored: {filename}")
+        elif os.path.isdir(os.path.join(backup_dir, filename)):
+            source = os.path.join(backup_dir, filename)
+            destination = os.path.join('data', filename)
+            shutil.copytree(source, destination, dirs_exist_ok=True)
+            restored_files += 1
+            print(f"✅ Restored: {filename}/")
     
     print(f"\n🎉 Restore completed!")
     print(f"📊 Files restored: {restored_files}")
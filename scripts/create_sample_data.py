@@ -4,9 +4,10 @@ import os
 def create_sample_data():
     """Create sample data files for testing"""
     
-    # Ensure data directory exists
-    if not os.path.exists("data"):
-        os.makedirs("data")
+    # Ensure data directories exist (levels and warnings are one file per server)
+    for directory in ("data", "data/user_levels", "data/user_warnings"):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
     
     # Sample guild configuration
     guild_configs = {
@@ -74,11 +75,9 @@ def create_sample_data():
     with open("data/guild_configs.json", "w") as f:
         json.dump(guild_configs, f, indent=2)
     
-    with open("data/user_levels.json", "w") as f:
-        json.dump(user_levels, f, indent=2)
-    
-    with open("data/user_warnings.json", "w") as f:
-        json.dump({}, f, indent=2)
+    for guild_id, levels in user_levels.items():
+        with open(f"data/user_levels/{guild_id}.json", "w") as f:
+            json.dump(levels, f, indent=2)
     
     with open("data/verification_data.json", "w") as f:
         json.dump(verification_data, f, indent=2)
@@ -10,7 +10,8 @@ import sys
 
 def create_directories():
     """Create necessary directories"""
-    directories = ['data', 'logs']
+    # Levels and warnings are stored one file per server under data/<store>/
+    directories = ['data', 'data/user_levels', 'data/user_warnings', 'logs']
     for directory in directories:
         if not os.path.exists(directory):
             os.makedirs(directory)
@@ -36,8 +37,6 @@ def create_default_configs():
     """Create default configuration files"""
     configs = {
         'guild_configs.json': {},
-        'user_levels.json': {},
-        'user_warnings.json': {},
         'verification_data.json': {},
         'keyword_config.json': {
             "keyword": "OG",
@@ -0,0 +1,29 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Run in an empty working directory, since the bot keeps its data under ./data"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DISCORD_REQUESTS_PER_SECOND', '1000')
+    return tmp_path / "data"
+
+@pytest.fixture
+def run():
+    """Run a coroutine function that receives a fresh bot, closing the bot afterwards"""
+    def runner(scenario):
+        import main
+        
+        async def wrapper():
+            bot = main.XLZRBot()
+            try:
+                return await scenario(bot)
+            finally:
+                await bot.close()
+        return asyncio.run(wrapper())
+    return runner
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+from utils.circuit_breaker import CircuitBreaker
+from utils.roblox import RobloxClient
+
+def test_cancelled_lookups_are_not_failures():
+    breaker = CircuitBreaker("Roblox", failure_threshold=1, cooldown=0)
+    client = RobloxClient(breaker=breaker)
+    
+    async def cancelled(path, payload):
+        raise asyncio.CancelledError
+    
+    async def failing(path, payload):
+        raise ConnectionError("down")
+    
+    client._post_with_retries = cancelled
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(client._post_batch("/v1/users", {}))
+    assert breaker.failures == 0
+    assert breaker.state == CircuitBreaker.CLOSED
+    
+    client._post_with_retries = failing
+    with pytest.raises(ConnectionError):
+        asyncio.run(client._post_batch("/v1/users", {}))
+    assert breaker.failures == 1
+    
+    # A cancelled half-open probe doesn't leave the circuit refusing every later call
+    client._post_with_retries = cancelled
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(client._post_batch("/v1/users", {}))
+    assert breaker.failures == 1
+    assert breaker.allow()
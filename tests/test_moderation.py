@@ -0,0 +1,26 @@
+import json
+import os
+
+def test_old_cog_warnings_file_is_merged_once(data_dir, run):
+    with open("user_warnings.json", 'w', encoding='utf-8') as f:
+        json.dump({"1": {"42": [
+            {'reason': 'spam', 'moderator': 'mod', 'timestamp': '2024-01-01T00:00:00', 'id': 1},
+            {'reason': 'raid', 'moderator': 'mod', 'timestamp': '2024-01-02T00:00:00', 'id': 2}
+        ]}}, f)
+    
+    async def first(bot):
+        await bot.load_guild_data("user_warnings", "1")
+        assert [w['reason'] for w in bot.user_warnings["1"]["42"]] == ['spam', 'raid']
+        await bot.save_all()
+    
+    async def second(bot):
+        await bot.load_guild_data("user_warnings", "1")
+        assert bot.user_warnings["1"].count("42") == 2
+    
+    run(first)
+    assert not os.path.exists("user_warnings.json")
+    assert os.path.exists("user_warnings.json.migrated")
+    
+    # Putting the file back (e.g. restoring an old backup) doesn't duplicate warnings
+    os.replace("user_warnings.json.migrated", "user_warnings.json")
+    run(second)
@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+from utils.levels import XPTable
+
+def make_message(guild_id: int, user_id: int, content: str = "hello"):
+    return SimpleNamespace(
+        author=SimpleNamespace(id=user_id, bot=False, name=f"user{user_id}", mention=f"<@{user_id}>"),
+        guild=SimpleNamespace(id=guild_id, get_channel=lambda channel_id: None),
+        channel=SimpleNamespace(id=1, name="general"),
+        content=content
+    )
+
+def test_rank_index_built_from_empty_table_gets_updates(data_dir, run):
+    async def scenario(bot):
+        async def no_commands(message):
+            pass
+        bot.process_commands = no_commands
+        
+        bot.user_levels["1"] = XPTable()
+        index = bot.get_rank_index("1")
+        assert len(index) == 0
+        
+        await bot.on_message(make_message(1, 42))
+        
+        assert bot.get_rank_index("1") is index
+        assert len(index) == 1
+        assert index.rank("42") == 1
+    
+    run(scenario)
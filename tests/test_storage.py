@@ -0,0 +1,67 @@
+import json
+import os
+
+import pytest
+
+from utils.storage import GuildNotLoadedError
+
+def test_sqlite_shards_load_off_the_event_loop(data_dir, run, monkeypatch):
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    
+    async def first(bot):
+        await bot.load_guild_data("user_levels", "1")
+        bot.user_levels["1"] = {"42": {'xp': 10, 'level': 2, 'last_message': 0}}
+        bot.mark_dirty("user_levels", "1")
+        await bot.save_all()
+    
+    async def second(bot):
+        assert "1" in bot.user_levels
+        with pytest.raises(GuildNotLoadedError):
+            bot.user_levels["1"]
+        await bot.load_guild_data("user_levels", "1")
+        assert bot.user_levels["1"]["42"]['level'] == 2
+    
+    run(first)
+    run(second)
+
+def test_sqlite_imports_data_left_by_the_sharded_json_backend(data_dir, run, monkeypatch):
+    os.makedirs("data")
+    with open(os.path.join("data", "user_levels.json"), 'w', encoding='utf-8') as f:
+        json.dump({"1": {"42": {'xp': 10, 'level': 2, 'last_message': 0}}}, f)
+    
+    async def on_json(bot):
+        await bot.load_guild_data("user_levels", "1")
+        bot.user_levels["1"]["42"]['level'] = 3
+        bot.mark_dirty("user_levels", "1", "42")
+        await bot.save_all()
+    
+    async def on_sqlite(bot):
+        await bot.load_guild_data("user_levels", "1")
+        assert bot.user_levels["1"]["42"]['level'] == 3
+    
+    monkeypatch.setenv('STORAGE_BACKEND', 'json')
+    run(on_json)
+    assert os.path.exists(os.path.join("data", "user_levels", "1.json"))
+    assert not os.path.exists(os.path.join("data", "user_levels.json"))
+    
+    monkeypatch.setenv('STORAGE_BACKEND', 'sqlite')
+    run(on_sqlite)
+    # Once imported the rows win, even without the JSON files
+    os.remove(os.path.join("data", "user_levels", "1.json"))
+    run(on_sqlite)
+
+def test_flat_file_does_not_overwrite_existing_shards(data_dir, run):
+    os.makedirs(os.path.join("data", "user_levels"))
+    with open(os.path.join("data", "user_levels", "1.json"), 'w', encoding='utf-8') as f:
+        json.dump({"42": {'xp': 500, 'level': 5, 'last_message': 0}}, f)
+    # What the old setup scripts wrote next to it
+    with open(os.path.join("data", "user_levels.json"), 'w', encoding='utf-8') as f:
+        json.dump({"1": {}, "2": {"7": {'xp': 10, 'level': 1, 'last_message': 0}}}, f)
+    
+    async def scenario(bot):
+        await bot.load_guild_data("user_levels", "1")
+        await bot.load_guild_data("user_levels", "2")
+        assert bot.user_levels["1"]["42"]['level'] == 5
+        assert bot.user_levels["2"]["7"]['xp'] == 10
+    
+    run(scenario)
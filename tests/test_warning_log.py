@@ -0,0 +1,57 @@
+import copy
+
+from utils.warning_log import WarningLog
+
+def warning(reason: str, expires_at: float = None):
+    entry = {'reason': reason, 'moderator': 'mod', 'timestamp': '2024-01-01T00:00:00'}
+    if expires_at is not None:
+        entry['expires_at'] = expires_at
+    return entry
+
+def assert_counts_match(log: WarningLog):
+    for user_id, warnings in log.items():
+        assert log.count(user_id) == len([w for w in warnings if not w.get('expired')]) == len(log.active(user_id))
+
+def test_active_count_follows_expiry_and_removal():
+    log = WarningLog()
+    first = log.add("1", warning("spam", expires_at=100))
+    log.add("1", warning("spam again", expires_at=200))
+    permanent = log.add("1", warning("raid"))
+    log.add("2", warning("ads", expires_at=100))
+    assert log.count("1") == 3
+    assert log.count("2") == 1
+    
+    expired = log.expire(now=150)
+    assert {(user_id, w['id']) for user_id, w in expired} == {("1", first['id']), ("2", 4)}
+    assert log.count("1") == 2
+    assert log.count("2") == 0
+    assert len(log["1"]) == 3  # Expired warnings are kept
+    assert_counts_match(log)
+    
+    # Removing an expired warning leaves the active count alone; removing an active one lowers it
+    log.remove("1", first)
+    assert log.count("1") == 2
+    log.remove("1", permanent)
+    assert log.count("1") == 1
+    assert_counts_match(log)
+    
+    log.remove("2", log["2"][0])
+    assert "2" not in log
+    assert log.count("2") == 0
+
+def test_active_count_follows_item_assignment_and_copies():
+    log = WarningLog({"1": [dict(warning("old"), id=1, expired=True), dict(warning("new"), id=2)]})
+    assert log.count("1") == 1
+    assert log.next_id == 3
+    
+    log["1"] = [dict(warning("a"), id=3), dict(warning("b"), id=4)]
+    assert log.count("1") == 2
+    
+    snapshot = copy.deepcopy(log)
+    log.add("1", warning("c"))
+    assert snapshot.count("1") == 2
+    assert log.count("1") == 3
+    
+    del log["1"]
+    assert log.count("1") == 0
+    assert_counts_match(snapshot)
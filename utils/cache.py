@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire, with single-flight loading
+    
+    Found values live for ``ttl`` seconds and ``None`` (not found) for
+    ``negative_ttl``. Concurrent ``get_or_load`` calls for the same key share
+    one in-flight load, which runs in its own task so a cancelled caller does
+    not cancel it for the others. Errors are passed to every waiter and never
+    cached.
+    """
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0, negative_ttl: float = 60.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+    
+    def put(self, key: Hashable, value: Any):
+        ttl = self.ttl if value is not None else self.negative_ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+    
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        found, value = self._lookup(key)
+        if found:
+            self.hits += 1
+            return value
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            inflight = self._inflight[key] = asyncio.create_task(self._load(key, loader))
+            # Mark a failure retrieved in case every waiter was cancelled
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+        # Shield so one cancelled waiter (including the first) does not cancel the shared load
+        return await asyncio.shield(inflight)
+    
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+        finally:
+            del self._inflight[key]
+        self.put(key, value)
+        return value
+    
+    @property
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0
+        }
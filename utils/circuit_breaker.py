@@ -0,0 +1,91 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+    
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """Stop calling an upstream after repeated failures
+    
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    ``allow`` refuses calls for ``cooldown`` seconds. Then a single probe
+    call is let through (half-open): success closes the circuit, failure
+    opens it for another cooldown.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+    
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 60.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.failures = 0
+        self._opened_at = 0.0
+        self._open = False
+        self._probing = False
+    
+    @property
+    def state(self) -> str:
+        if not self._open:
+            return self.CLOSED
+        if time.monotonic() - self._opened_at >= self.cooldown:
+            return self.HALF_OPEN
+        return self.OPEN
+    
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being refused (open, or half-open with the probe in flight)"""
+        state = self.state
+        return state == self.OPEN or (state == self.HALF_OPEN and self._probing)
+    
+    @property
+    def retry_after(self) -> float:
+        if not self._open:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+    
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; in half-open state only one probe is allowed"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+    
+    def check(self):
+        """``allow`` that raises ``CircuitOpenError`` when the call is refused"""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after or self.cooldown)
+    
+    def record_success(self):
+        if self._open:
+            logger.info(f"{self.name} circuit closed, upstream recovered")
+        self.failures = 0
+        self._open = False
+        self._probing = False
+    
+    def release(self):
+        """Give up on a call without counting it either way (e.g. it was cancelled)
+        
+        Frees the half-open probe slot so the next call can probe instead.
+        """
+        self._probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or (not self._open and self.failures >= self.failure_threshold):
+            if not self._open:
+                logger.warning(f"{self.name} circuit opened after {self.failures} failures; pausing for {self.cooldown:.0f}s")
+            self._open = True
+            self._opened_at = time.monotonic()
+            self._probing = False
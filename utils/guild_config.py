@@ -0,0 +1,73 @@
+from string import Formatter
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+def parse_color(value: Any, default: int) -> int:
+    """Turn a stored '#rrggbb' / '0xrrggbb' color into an int, falling back to ``default``"""
+    if isinstance(value, int):
+        return value
+    try:
+        return int(str(value).replace('#', '0x'), 16)
+    except (TypeError, ValueError):
+        return default
+
+class MessageTemplate:
+    """A message with ``{placeholder}`` fields, split into pieces once
+    
+    Rendering only joins the pre-split literals with the placeholder values.
+    Unknown placeholders are left as-is instead of raising.
+    """
+    
+    __slots__ = ('_parts',)
+    
+    def __init__(self, text: str):
+        parts: List[Tuple[str, Optional[str], str]] = []
+        try:
+            for literal, field, spec, _ in Formatter().parse(text):
+                parts.append((literal, field, spec or ''))
+        except ValueError:
+            # Unbalanced braces: show the text exactly as configured
+            parts = [(text, None, '')]
+        self._parts = tuple(parts)
+    
+    def render(self, **values: Any) -> str:
+        pieces = []
+        for literal, field, spec in self._parts:
+            pieces.append(literal)
+            if field is None:
+                continue
+            if field in values:
+                try:
+                    pieces.append(format(values[field], spec))
+                except ValueError:
+                    pieces.append(str(values[field]))
+            else:
+                pieces.append('{' + field + (':' + spec if spec else '') + '}')
+        return ''.join(pieces)
+
+class AnnouncementConfig:
+    """Compiled welcome/goodbye/level-up settings"""
+    
+    __slots__ = ('enabled', 'channel_id', 'color', 'template', 'gif', 'thumbnail')
+    
+    def __init__(self, raw: Dict[str, Any], default_message: str, default_color: int):
+        self.enabled = bool(raw.get('enabled', False))
+        self.channel_id = raw.get('channel_id')
+        self.color = parse_color(raw.get('color'), default_color)
+        self.template = MessageTemplate(raw.get('message', default_message))
+        self.gif = raw.get('gif')
+        self.thumbnail = raw.get('thumbnail', 'avatar')
+
+class CompiledGuildConfig:
+    """Everything the per-message and join/leave handlers need, pre-parsed
+    
+    Built from ``bot.guild_configs[guild_id]`` and cached until that guild's
+    config is marked dirty again.
+    """
+    
+    __slots__ = ('command_only_channels', 'welcome', 'goodbye', 'leveling')
+    
+    def __init__(self, raw: Dict[str, Any]):
+        self.command_only_channels: FrozenSet[int] = frozenset(raw.get('command_only', {}).get('channels', []))
+        self.welcome = AnnouncementConfig(raw.get('welcome', {}), 'Welcome {mention} to {server}!', 0x7289da)
+        self.goodbye = AnnouncementConfig(raw.get('goodbye', {}), 'Goodbye {user}! Thanks for being part of {server}.', 0xff0000)
+        self.leveling = AnnouncementConfig(raw.get('leveling', {}), 'Congratulations {mention}! You reached level {level}!', 0xffd700)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+import aiohttp
+import discord
+
+logger = logging.getLogger(__name__)
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a failed Discord/HTTP call is worth retrying (not a permission or missing-object error)"""
+    if isinstance(error, (discord.Forbidden, discord.NotFound)):
+        return False
+    return isinstance(error, (discord.HTTPException, aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+class JobQueue:
+    """Bounded queue of background jobs run by a fixed number of workers
+    
+    ``submit`` waits while the queue is full and returns a future for the
+    job's result. A job whose error passes ``should_retry`` is run again up
+    to ``max_retries`` times with exponential backoff; otherwise (or once
+    retries run out) the error is set on the future.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        workers: int = 4,
+        max_size: int = 100,
+        max_retries: int = 3,
+        retry_delay: float = 1.0,
+        should_retry: Callable[[BaseException], bool] = is_transient_error
+    ):
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.should_retry = should_retry
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+    
+    def __len__(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+    
+    def start(self):
+        """Start the workers (done on the first ``submit`` if not called earlier)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+    
+    async def submit(self, job: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((job, future))
+        return future
+    
+    async def _work(self):
+        while True:
+            job, future = await self._queue.get()
+            try:
+                if not future.cancelled():
+                    await self._run(job, future)
+            finally:
+                self._queue.task_done()
+    
+    async def _run(self, job: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        attempt = 0
+        while True:
+            try:
+                result = await job()
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as e:
+                if attempt < self.max_retries and self.should_retry(e):
+                    delay = self.retry_delay * 2 ** attempt
+                    attempt += 1
+                    logger.warning(f"{self.name}: job failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                if not future.cancelled():
+                    future.set_exception(e)
+                    future.exception()  # Mark retrieved in case nobody awaits the job
+                return
+            if not future.cancelled():
+                future.set_result(result)
+            return
+    
+    async def close(self):
+        """Stop the workers and cancel jobs that have not finished"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._queue is not None:
+            while not self._queue.empty():
+                _, future = self._queue.get_nowait()
+                future.cancel()
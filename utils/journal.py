@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, Callable, Dict, Iterator, List, Set, Tuple
+
+from utils.storage import fsync_directory
+
+logger = logging.getLogger(__name__)
+
+class AppendLog:
+    """Append-only log of text records split into numbered segment files
+    
+    ``append`` only buffers; ``flush`` writes the buffer to the current
+    segment and fsyncs it on a worker thread. ``rotate`` starts a new segment
+    so that, once a snapshot containing everything up to the rotation has
+    been committed, ``discard_through`` can delete the older segments.
+    """
+    
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.name = name
+        self._pattern = re.compile(rf"^{re.escape(name)}\.(\d+)\.log$")
+        self._buffer: List[str] = []
+        self._lock = asyncio.Lock()
+        
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        # Never append to a segment left behind by a previous run: its last
+        # line may be torn, so always start a fresh one.
+        existing = self.segments()
+        self.seq = existing[-1] + 1 if existing else 1
+    
+    def segment_path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{self.name}.{seq:08d}.log")
+    
+    def segments(self) -> List[int]:
+        """Sequence numbers of the segments on disk, oldest first"""
+        found = []
+        for filename in os.listdir(self.directory):
+            match = self._pattern.match(filename)
+            if match:
+                found.append(int(match.group(1)))
+        return sorted(found)
+    
+    def append(self, record: str):
+        """Buffer one record (a single line without the newline)"""
+        self._buffer.append(record)
+    
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+    
+    def _write(self, path: str, lines: List[str]):
+        is_new = not os.path.exists(path)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        if is_new:
+            fsync_directory(self.directory)
+    
+    async def flush(self) -> int:
+        """Write buffered records to disk; returns how many were written"""
+        if not self._buffer:
+            return 0
+        async with self._lock:
+            lines, self._buffer = self._buffer, []
+            if not lines:
+                return 0
+            try:
+                await asyncio.to_thread(self._write, self.segment_path(self.seq), lines)
+            except Exception:
+                self._buffer[:0] = lines
+                raise
+            return len(lines)
+    
+    def rotate(self) -> int:
+        """Start a new segment and return the sequence number of the sealed one"""
+        sealed = self.seq
+        self.seq += 1
+        return sealed
+    
+    def replay(self) -> Iterator[str]:
+        """Yield every record on disk in append order (startup only)"""
+        for seq in self.segments():
+            with open(self.segment_path(seq), 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if line.endswith('\n'):
+                        yield line[:-1]
+                    # A line without its newline was torn by a crash; drop it
+    
+    async def discard_through(self, seq: int):
+        """Delete segments up to and including ``seq``"""
+        async with self._lock:
+            for existing in self.segments():
+                if existing > seq:
+                    break
+                try:
+                    os.remove(self.segment_path(existing))
+                except OSError as e:
+                    logger.warning(f"Could not remove journal segment {existing}: {e}")
+
+class XPJournal(AppendLog):
+    """Write-ahead journal of XP/level changes
+    
+    Each record holds a user's full XP state (``guild user xp level
+    last_message``), so replaying a record more than once is harmless.
+    """
+    
+    def __init__(self, directory: str):
+        super().__init__(directory, "xp")
+    
+    def record(self, guild_id: str, user_id: str, user_data: Dict[str, Any]):
+        """Journal a user's current XP state"""
+        self.append(f"{guild_id} {user_id} {user_data['xp']} {user_data['level']} {user_data.get('last_message', 0)}")
+    
+    def replay_into(self, user_levels: Dict[str, Any], guild_factory: Callable = dict) -> Set[Tuple[str, str]]:
+        """Apply journalled records to ``user_levels``; returns the (guild, user) pairs touched"""
+        touched = set()
+        for line in self.replay():
+            try:
+                guild_id, user_id, xp, level, last_message = line.split(' ')
+                state = {'xp': int(xp), 'level': int(level), 'last_message': float(last_message)}
+            except ValueError:
+                logger.warning(f"Skipping malformed XP journal record: {line!r}")
+                continue
+            if guild_id not in user_levels:
+                user_levels[guild_id] = guild_factory()
+            user_levels[guild_id].setdefault(user_id, {}).update(state)
+            touched.add((guild_id, user_id))
+        return touched
+
+class WarningJournal(AppendLog):
+    """Write-ahead journal of issued warnings
+    
+    Each record is ``guild user <warning JSON>``. Warnings carry a guild-wide
+    ID, so records already contained in the saved snapshot are skipped on
+    replay.
+    """
+    
+    def __init__(self, directory: str):
+        super().__init__(directory, "warnings")
+    
+    def record(self, guild_id: str, user_id: str, warning: Dict[str, Any]):
+        """Journal a newly added warning"""
+        self.append(f"{guild_id} {user_id} {json.dumps(warning, ensure_ascii=False, separators=(',', ':'))}")
+    
+    def replay_into(self, user_warnings: Dict[str, Any], guild_factory: Callable = dict) -> Set[Tuple[str, str]]:
+        """Add journalled warnings missing from ``user_warnings``; returns the (guild, user) pairs touched"""
+        touched = set()
+        for line in self.replay():
+            try:
+                guild_id, user_id, payload = line.split(' ', 2)
+                warning = json.loads(payload)
+            except ValueError:
+                logger.warning(f"Skipping malformed warning journal record: {line!r}")
+                continue
+            if guild_id not in user_warnings:
+                user_warnings[guild_id] = guild_factory()
+            log = user_warnings[guild_id]
+            if log.find(user_id, warning.get('id')) is None:
+                log.add(user_id, warning)
+                touched.add((guild_id, user_id))
+        return touched
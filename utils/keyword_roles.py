@@ -0,0 +1,169 @@
+import re
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import discord
+
+REGEX_PREFIX = "regex:"
+
+class AhoCorasick:
+    """Finds every occurrence of many literal patterns in one pass over the text"""
+    
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        
+        for pattern_id, pattern in enumerate(patterns):
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][char] = nxt
+                state = nxt
+            self._out[state] += (pattern_id,)
+        
+        # Breadth-first so every node's fail target is finished before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] += self._out[self._fail[child]]
+    
+    def search(self, text: str) -> Set[int]:
+        """IDs of all patterns that occur in ``text``"""
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+def keyword_rules(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A guild's keyword rules, reading the old single keyword/role format too"""
+    if 'rules' in config:
+        return config['rules']
+    if config.get('keyword'):
+        return [{
+            'pattern': config['keyword'],
+            'regex': False,
+            'role_id': config.get('role_id'),
+            'role_name': config.get('role_name', 'OG member')
+        }]
+    return []
+
+def editable_rules(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A guild's rule list for editing, moving an old single keyword into it first"""
+    if 'rules' not in config:
+        config['rules'] = keyword_rules(config)
+        for key in ('keyword', 'role_name', 'role_id'):
+            config.pop(key, None)
+    return config['rules']
+
+def describe_rule(rule: Dict[str, Any]) -> str:
+    return f"{REGEX_PREFIX}{rule['pattern']}" if rule.get('regex') else rule['pattern']
+
+class KeywordRoleMatcher:
+    """One guild's keyword → role rules compiled for single-pass matching
+    
+    Literal keywords (case-insensitive substrings) go into one Aho-Corasick
+    automaton, so checking a display name against them is a single scan no
+    matter how many there are. Regex rules share one compiled pattern and
+    are evaluated with a single match call, except rules with groups of
+    their own: wrapping them would renumber the groups and break
+    backreferences like ``\\1``, so those are matched one by one. Roles
+    are looked up by ID; rules saved with only a role name are resolved by
+    name once and the ID is remembered.
+    """
+    
+    def __init__(self, rules: List[Dict[str, Any]]):
+        self.rules = rules
+        self._literal_rules: List[int] = []
+        self._regex_rules: List[int] = []
+        self._separate: List[Tuple[int, re.Pattern]] = []
+        literals = []
+        regexes = []
+        for index, rule in enumerate(rules):
+            if rule.get('regex'):
+                pattern = re.compile(rule['pattern'], re.IGNORECASE)
+                if pattern.groups:
+                    self._separate.append((index, pattern))
+                else:
+                    self._regex_rules.append(index)
+                    regexes.append(rule['pattern'])
+            else:
+                self._literal_rules.append(index)
+                literals.append(rule['pattern'].lower())
+        
+        self._automaton = AhoCorasick(literals)
+        self._combined: Optional[re.Pattern] = None
+        if regexes:
+            # Each rule sits in its own optional lookahead, so every rule that
+            # matches at a position is reported, not just the first alternative
+            combined = ''.join(f"(?=.*?(?P<r{i}>{pattern}))?" for i, pattern in enumerate(regexes))
+            try:
+                self._combined = re.compile(rf"^{combined}", re.IGNORECASE | re.DOTALL)
+            except re.error:
+                # e.g. inline flags that are only allowed at the start; match them one by one
+                self._separate += [(index, re.compile(pattern, re.IGNORECASE)) for index, pattern in zip(self._regex_rules, regexes)]
+                self._regex_rules = []
+        
+        self._resolved_ids: Dict[int, int] = {}
+    
+    def matching_rules(self, text: str) -> Set[int]:
+        """Indices of the rules that match ``text``"""
+        matched = {self._literal_rules[i] for i in self._automaton.search(text.lower())}
+        if self._combined is not None:
+            match = self._combined.match(text)
+            for i, rule_index in enumerate(self._regex_rules):
+                if match.group(f"r{i}") is not None:
+                    matched.add(rule_index)
+        for rule_index, pattern in self._separate:
+            if pattern.search(text):
+                matched.add(rule_index)
+        return matched
+    
+    def resolve_role(self, guild: discord.Guild, index: int) -> Optional[discord.Role]:
+        rule = self.rules[index]
+        role_id = self._resolved_ids.get(index) or rule.get('role_id')
+        role = guild.get_role(role_id) if role_id else None
+        if role is None and rule.get('role_name'):
+            role = discord.utils.get(guild.roles, name=rule['role_name'])
+            if role:
+                self._resolved_ids[index] = role.id
+        return role
+    
+    def plan(self, guild: discord.Guild, text: str) -> Tuple[List[discord.Role], List[discord.Role]]:
+        """``(roles to have, roles to not have)`` for a display name
+        
+        A role wanted by any matching rule is kept even if another rule for
+        the same role does not match.
+        """
+        matched = self.matching_rules(text)
+        wanted: Dict[int, discord.Role] = {}
+        managed: Dict[int, discord.Role] = {}
+        for index in range(len(self.rules)):
+            role = self.resolve_role(guild, index)
+            if role is None:
+                continue
+            managed[role.id] = role
+            if index in matched:
+                wanted[role.id] = role
+        unwanted = [role for role_id, role in managed.items() if role_id not in wanted]
+        return list(wanted.values()), unwanted
@@ -0,0 +1,179 @@
+from array import array
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, Mapping, Tuple
+
+FIELDS = ('xp', 'level', 'last_message')
+
+def total_xp(level: int, xp: int) -> int:
+    """XP earned overall: level N takes N * 100 XP and resets the counter"""
+    return 50 * level * (level - 1) + xp
+
+class XPRecord(MutableMapping):
+    """Mapping view of one user's row in an ``XPTable``
+    
+    Behaves like the old ``{'xp': ..., 'level': ..., 'last_message': ...}``
+    dict, but reads and writes go straight to the table's arrays.
+    """
+    
+    __slots__ = ('_table', '_user_id')
+    
+    def __init__(self, table: 'XPTable', user_id: int):
+        self._table = table
+        self._user_id = user_id
+    
+    def _column(self, key: str) -> array:
+        if key == 'xp':
+            return self._table._xp
+        if key == 'level':
+            return self._table._level
+        if key == 'last_message':
+            return self._table._last_message
+        raise KeyError(key)
+    
+    def __getitem__(self, key: str) -> Any:
+        return self._column(key)[self._table._index[self._user_id]]
+    
+    def __setitem__(self, key: str, value: Any):
+        self._column(key)[self._table._index[self._user_id]] = value
+    
+    def __delitem__(self, key: str):
+        raise TypeError("XP record fields cannot be deleted")
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+    
+    def __len__(self) -> int:
+        return len(FIELDS)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        row = self._table._index[self._user_id]
+        return {
+            'xp': self._table._xp[row],
+            'level': self._table._level[row],
+            'last_message': self._table._last_message[row]
+        }
+    
+    def __deepcopy__(self, memo: dict) -> Dict[str, Any]:
+        # Snapshots only need the values, not a live view
+        return self.to_dict()
+    
+    def __repr__(self) -> str:
+        return f"XPRecord({self.to_dict()})"
+
+class XPTable(MutableMapping):
+    """One guild's XP records stored as parallel arrays
+    
+    User IDs are kept as ints in a single index dict that maps to a row in
+    the ``xp``/``level``/``last_message`` columns, which costs a few dozen
+    bytes per user instead of a dict per user. The public interface still
+    uses string user IDs and dict-like records, and ``to_dict`` produces the
+    original JSON shape.
+    """
+    
+    __slots__ = ('_index', '_user_ids', '_xp', '_level', '_last_message')
+    
+    def __init__(self, records: Mapping[str, Mapping[str, Any]] = None):
+        self._index: Dict[int, int] = {}
+        self._user_ids = array('q')
+        self._xp = array('q')
+        self._level = array('l')
+        self._last_message = array('d')
+        if records:
+            for user_id, record in records.items():
+                self[user_id] = record
+    
+    @staticmethod
+    def _key(user_id: Any) -> int:
+        return int(user_id)
+    
+    def __getitem__(self, user_id: Any) -> XPRecord:
+        try:
+            key = self._key(user_id)
+        except (TypeError, ValueError):
+            raise KeyError(user_id)
+        if key not in self._index:
+            raise KeyError(user_id)
+        return XPRecord(self, key)
+    
+    def __setitem__(self, user_id: Any, record: Mapping[str, Any]):
+        key = self._key(user_id)
+        xp = int(record.get('xp', 0))
+        level = int(record.get('level', 1))
+        last_message = float(record.get('last_message', 0))
+        
+        row = self._index.get(key)
+        if row is None:
+            self._index[key] = len(self._user_ids)
+            self._user_ids.append(key)
+            self._xp.append(xp)
+            self._level.append(level)
+            self._last_message.append(last_message)
+        else:
+            self._xp[row] = xp
+            self._level[row] = level
+            self._last_message[row] = last_message
+    
+    def __delitem__(self, user_id: Any):
+        try:
+            key = self._key(user_id)
+            row = self._index.pop(key)
+        except (TypeError, ValueError):
+            raise KeyError(user_id)
+        
+        # Move the last row into the gap so the columns stay dense
+        last = len(self._user_ids) - 1
+        if row != last:
+            moved = self._user_ids[last]
+            self._user_ids[row] = moved
+            self._xp[row] = self._xp[last]
+            self._level[row] = self._level[last]
+            self._last_message[row] = self._last_message[last]
+            self._index[moved] = row
+        for column in (self._user_ids, self._xp, self._level, self._last_message):
+            column.pop()
+    
+    def __contains__(self, user_id: object) -> bool:
+        try:
+            return self._key(user_id) in self._index
+        except (TypeError, ValueError):
+            return False
+    
+    def __iter__(self) -> Iterator[str]:
+        return (str(user_id) for user_id in self._user_ids)
+    
+    def __len__(self) -> int:
+        return len(self._user_ids)
+    
+    def rows(self) -> Iterator[Tuple[int, int, int]]:
+        """``(user_id, xp, level)`` for every user, straight from the columns"""
+        return zip(self._user_ids, self._xp, self._level)
+    
+    def setdefault(self, user_id: Any, default: Mapping[str, Any] = None) -> XPRecord:
+        """Insert ``default`` if missing and return the live record view"""
+        if user_id not in self:
+            self[user_id] = default or {}
+        return self[user_id]
+    
+    def to_dict(self) -> Dict[str, Dict[str, Any]]:
+        """The JSON-compatible ``{user_id: {'xp', 'level', 'last_message'}}`` shape"""
+        return {
+            str(self._user_ids[row]): {
+                'xp': self._xp[row],
+                'level': self._level[row],
+                'last_message': self._last_message[row]
+            }
+            for row in range(len(self._user_ids))
+        }
+    
+    def __deepcopy__(self, memo: dict) -> 'XPTable':
+        # Copying the arrays is a flat memcpy, far cheaper than per-user dicts
+        table = XPTable()
+        table._index = dict(self._index)
+        table._user_ids = array('q', self._user_ids)
+        table._xp = array('q', self._xp)
+        table._level = array('l', self._level)
+        table._last_message = array('d', self._last_message)
+        return table
+    
+    def __repr__(self) -> str:
+        return f"XPTable({len(self)} users)"
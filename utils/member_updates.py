@@ -0,0 +1,74 @@
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+class MemberUpdate:
+    """Nickname and role changes for one member, sent as a single edit
+    
+    Only differences from the member's current state are recorded, so an
+    update that changes nothing makes no API call at all.
+    """
+    
+    def __init__(self, member: discord.Member):
+        self.member = member
+        self.nick: Optional[str] = None
+        self.added: List[discord.Role] = []
+        self.removed: List[discord.Role] = []
+    
+    def set_nick(self, nick: str):
+        self.nick = nick if nick != self.member.nick else None
+    
+    def add_role(self, role: discord.Role):
+        if role in self.removed:
+            self.removed.remove(role)
+        if role not in self.member.roles and role not in self.added:
+            self.added.append(role)
+    
+    def remove_role(self, role: discord.Role):
+        if role in self.added:
+            self.added.remove(role)
+        if role in self.member.roles and role not in self.removed:
+            self.removed.append(role)
+    
+    @property
+    def roles(self) -> List[discord.Role]:
+        """The member's full role list after the update (without @everyone)"""
+        return [
+            role for role in self.member.roles
+            if not role.is_default() and role not in self.removed
+        ] + self.added
+    
+    def changes(self) -> Dict[str, Any]:
+        """Keyword arguments for ``member.edit``"""
+        changes = {}
+        if self.nick is not None:
+            changes['nick'] = self.nick
+        if self.added or self.removed:
+            changes['roles'] = self.roles
+        return changes
+    
+    async def apply(self, request: Callable[..., Awaitable[Any]]) -> Tuple[bool, bool]:
+        """Send the edit through ``request`` (e.g. ``bot.discord_request``)
+        
+        Returns whether the nickname and the roles ended up as planned. If
+        the combined edit is forbidden (say the bot may manage roles but the
+        member outranks it for nicknames) each part is retried on its own.
+        """
+        changes = self.changes()
+        if not changes:
+            return True, True
+        try:
+            await request(self.member.edit, **changes)
+            return True, True
+        except discord.Forbidden:
+            if len(changes) == 1:
+                return 'nick' not in changes, 'roles' not in changes
+        
+        results = []
+        for key in ('nick', 'roles'):
+            try:
+                await request(self.member.edit, **{key: changes[key]})
+                results.append(True)
+            except discord.Forbidden:
+                results.append(False)
+        return results[0], results[1]
@@ -0,0 +1,147 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import discord
+
+from utils.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+MAX_EMBEDS = 10  # Per message
+MAX_EMBED_CHARS = 6000  # Across all embeds of one message
+
+Entry = Tuple[int, int, discord.Embed, asyncio.Future]
+
+class Outbox:
+    """Per-channel queue that sends embeds as few messages as possible
+    
+    Embeds posted to a channel wait ``flush_delay`` seconds and are then
+    sent together, up to 10 (and 6000 characters) per message, through
+    ``request`` (e.g. ``bot.discord_request``, which handles 429s). Each
+    channel has its own token bucket matching Discord's per-channel send
+    limit, and whenever a message is about to go out the queued embeds with
+    the highest priority (``MODERATION`` before ``ANNOUNCEMENT``) go first.
+    
+    ``post`` returns a future for the sent message; failures are logged,
+    so callers don't have to await it.
+    """
+    
+    MODERATION = 0
+    ANNOUNCEMENT = 1
+    
+    def __init__(
+        self,
+        request: Callable[..., Awaitable[Any]],
+        flush_delay: float = 0.5,
+        rate: float = 1.0,
+        burst: float = 5.0
+    ):
+        self.request = request
+        self.flush_delay = flush_delay
+        self.rate = rate
+        self.burst = burst
+        self._pending: Dict[int, List[Entry]] = {}
+        self._channels: Dict[int, discord.abc.Messageable] = {}
+        self._limiters: Dict[int, TokenBucket] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._order = itertools.count()
+        self.messages_sent = 0
+        self.embeds_sent = 0
+    
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._pending.values())
+    
+    def post(self, channel: discord.abc.Messageable, embed: discord.Embed, priority: int = ANNOUNCEMENT) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._pending.setdefault(channel.id, []), (priority, next(self._order), embed, future))
+        self._channels[channel.id] = channel
+        if channel.id not in self._tasks:
+            self._tasks[channel.id] = asyncio.create_task(self._drain(channel.id))
+        return future
+    
+    async def _drain(self, channel_id: int):
+        try:
+            await asyncio.sleep(self.flush_delay)
+            while self._pending.get(channel_id):
+                await self._limiter(channel_id).acquire()
+                await self._send_next(channel_id)
+        finally:
+            del self._tasks[channel_id]
+            if not self._pending.get(channel_id):
+                self._pending.pop(channel_id, None)
+                self._channels.pop(channel_id, None)
+    
+    def _limiter(self, channel_id: int) -> TokenBucket:
+        limiter = self._limiters.get(channel_id)
+        if limiter is None:
+            limiter = self._limiters[channel_id] = TokenBucket(self.rate, self.burst)
+        return limiter
+    
+    def _take_batch(self, queue: List[Entry]) -> List[Entry]:
+        """Highest-priority embeds that fit in one message"""
+        batch = []
+        size = 0
+        while queue and len(batch) < MAX_EMBEDS:
+            embed_size = len(queue[0][2])
+            if batch and size + embed_size > MAX_EMBED_CHARS:
+                break
+            size += embed_size
+            batch.append(heapq.heappop(queue))
+        return batch
+    
+    async def _send_next(self, channel_id: int):
+        channel = self._channels[channel_id]
+        queue = self._pending[channel_id]
+        batch = self._take_batch(queue)
+        try:
+            await self._deliver(channel, batch)
+        except asyncio.CancelledError:
+            # Put the batch back so close() can still send it
+            for entry in batch:
+                heapq.heappush(queue, entry)
+            raise
+    
+    async def _deliver(self, channel: discord.abc.Messageable, batch: List[Entry]):
+        try:
+            message = await self.request(channel.send, embeds=[entry[2] for entry in batch])
+        except discord.HTTPException as e:
+            if len(batch) > 1 and e.status == 400:
+                # One bad embed rejects the whole message; split it to send the rest
+                middle = len(batch) // 2
+                await self._deliver(channel, batch[:middle])
+                await self._deliver(channel, batch[middle:])
+            else:
+                self._fail(channel, batch, e)
+            return
+        except Exception as e:
+            self._fail(channel, batch, e)
+            return
+        
+        self.messages_sent += 1
+        self.embeds_sent += len(batch)
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_result(message)
+    
+    def _fail(self, channel: discord.abc.Messageable, batch: List[Entry], error: Exception):
+        logger.warning(f"Cannot send {len(batch)} embed(s) to {getattr(channel, 'name', channel.id)}: {error}")
+        for _, _, _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+                future.exception()  # Mark retrieved in case nobody awaits the message
+    
+    async def close(self):
+        """Send everything still queued, without waiting for the flush window"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for channel_id, queue in list(self._pending.items()):
+            channel = self._channels[channel_id]
+            while queue:
+                await self._deliver(channel, self._take_batch(queue))
+        self._pending.clear()
+        self._channels.clear()
@@ -0,0 +1,175 @@
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.levels import total_xp
+
+class OrderStatisticList:
+    """Sorted list with O(log n) rank lookups and O(log n + k) slicing
+    
+    Values live in sublists of bounded size; a Fenwick tree over the
+    sublist lengths turns "how many values come before sublist i" and
+    "which sublist holds position k" into logarithmic operations.
+    """
+    
+    LOAD = 512
+    
+    def __init__(self, iterable: Iterable[Any] = ()):
+        values = sorted(iterable)
+        self._lists: List[List[Any]] = [values[i:i + self.LOAD] for i in range(0, len(values), self.LOAD)]
+        self._maxes: List[Any] = [sublist[-1] for sublist in self._lists]
+        self._len = len(values)
+        self._rebuild_tree()
+    
+    def __len__(self) -> int:
+        return self._len
+    
+    def _rebuild_tree(self):
+        size = len(self._lists)
+        tree = [0] * (size + 1)
+        for i, sublist in enumerate(self._lists, 1):
+            tree[i] += len(sublist)
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+    
+    def _tree_add(self, index: int, delta: int):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+    
+    def _prefix(self, index: int) -> int:
+        """Number of values in sublists before ``index``"""
+        total = 0
+        i = index
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+    
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """(sublist index, offset) of the value at ``position``"""
+        index = 0
+        remaining = position
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = index + step
+            if nxt < len(self._tree) and self._tree[nxt] <= remaining:
+                index = nxt
+                remaining -= self._tree[nxt]
+            step >>= 1
+        return index, remaining
+    
+    def add(self, value: Any):
+        if not self._lists:
+            self._lists.append([value])
+            self._maxes.append(value)
+            self._len = 1
+            self._rebuild_tree()
+            return
+        
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            i -= 1
+            self._lists[i].append(value)
+            self._maxes[i] = value
+        else:
+            insort(self._lists[i], value)
+        self._len += 1
+        
+        if len(self._lists[i]) > 2 * self.LOAD:
+            sublist = self._lists[i]
+            self._lists[i:i + 1] = [sublist[:self.LOAD], sublist[self.LOAD:]]
+            self._maxes[i:i + 1] = [sublist[self.LOAD - 1], sublist[-1]]
+            self._rebuild_tree()
+        else:
+            self._tree_add(i, 1)
+    
+    def remove(self, value: Any):
+        i = bisect_left(self._maxes, value)
+        if i == len(self._maxes):
+            raise ValueError(f"{value!r} not in list")
+        sublist = self._lists[i]
+        j = bisect_left(sublist, value)
+        if j == len(sublist) or sublist[j] != value:
+            raise ValueError(f"{value!r} not in list")
+        
+        del sublist[j]
+        self._len -= 1
+        if sublist:
+            self._maxes[i] = sublist[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+    
+    def index(self, value: Any) -> int:
+        """Zero-based position of ``value``"""
+        i = bisect_left(self._maxes, value)
+        if i < len(self._maxes):
+            sublist = self._lists[i]
+            j = bisect_left(sublist, value)
+            if j < len(sublist) and sublist[j] == value:
+                return self._prefix(i) + j
+        raise ValueError(f"{value!r} not in list")
+    
+    def islice(self, start: int, stop: int) -> Iterator[Any]:
+        """Values from position ``start`` up to (not including) ``stop``"""
+        stop = min(stop, self._len)
+        if start >= stop:
+            return
+        i, j = self._locate(start)
+        remaining = stop - start
+        while remaining > 0 and i < len(self._lists):
+            chunk = self._lists[i][j:j + remaining]
+            yield from chunk
+            remaining -= len(chunk)
+            i += 1
+            j = 0
+
+class RankIndex:
+    """Leaderboard order for one guild, maintained incrementally
+    
+    Members are ordered by total XP earned (highest first), ties broken by
+    user ID. ``table`` is the ``XPTable`` the index was built from, so a
+    reloaded guild can be detected and re-indexed.
+    """
+    
+    def __init__(self, table: Any):
+        self.table = table
+        self._keys: Dict[int, Tuple[int, int]] = {}
+        for user_id, xp, level in table.rows():
+            self._keys[user_id] = (-total_xp(level, xp), user_id)
+        self._order = OrderStatisticList(self._keys.values())
+    
+    def __len__(self) -> int:
+        return len(self._order)
+    
+    def update(self, user_id: str, level: int, xp: int):
+        """Re-rank one member after an XP change"""
+        uid = int(user_id)
+        key = (-total_xp(level, xp), uid)
+        old = self._keys.get(uid)
+        if old == key:
+            return
+        if old is not None:
+            self._order.remove(old)
+        self._order.add(key)
+        self._keys[uid] = key
+    
+    def rank(self, user_id: str) -> Optional[int]:
+        """1-based rank of a member, or None if they have no XP record"""
+        key = self._keys.get(int(user_id))
+        if key is None:
+            return None
+        return self._order.index(key) + 1
+    
+    def page(self, page: int, per_page: int = 10) -> List[Tuple[int, str, int]]:
+        """``(rank, user_id, total_xp)`` entries for a 1-based page"""
+        start = (page - 1) * per_page
+        return [
+            (rank, str(user_id), -negative_total)
+            for rank, (negative_total, user_id) in enumerate(self._order.islice(start, start + per_page), start + 1)
+        ]
@@ -0,0 +1,52 @@
+import asyncio
+import time
+from typing import Optional
+
+class TokenBucket:
+    """Async token bucket limiting calls to one upstream API
+    
+    Allows ``rate`` acquisitions per second on average with bursts of up to
+    ``capacity``. ``pause`` blocks every caller until a server-specified
+    ``Retry-After`` delay has passed.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until ``tokens`` can be taken"""
+        # The lock makes waiters queue up in order instead of racing for refills
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+    
+    def pause(self, seconds: float):
+        """Hold all callers for ``seconds`` (e.g. after a 429) and drop any saved-up burst"""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+
+def parse_retry_after(value: Optional[str], default: float = 5.0) -> float:
+    """Seconds to wait from a ``Retry-After`` header value"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return default
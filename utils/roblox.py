@@ -0,0 +1,164 @@
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiohttp
+
+from utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.ratelimit import TokenBucket, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+USERS_API = "https://users.roblox.com"
+
+# Largest batch the users API accepts per request
+BATCH_SIZE = 100
+
+class RobloxClient:
+    """Roblox users API client that reuses one pooled HTTP session
+    
+    The session keeps connections alive and caches DNS lookups, so repeated
+    lookups skip the TCP/TLS handshake. Call ``start`` from inside the event
+    loop (the bot does it in ``setup_hook``) and ``close`` on shutdown.
+    
+    Every request first takes a token from ``limiter``; a ``429`` response
+    pauses the limiter for the ``Retry-After`` delay and is retried. When
+    ``breaker`` is open, requests fail fast with ``CircuitOpenError``.
+    """
+    
+    def __init__(
+        self,
+        max_connections: int = 20,
+        timeout: float = 10.0,
+        limiter: Optional[TokenBucket] = None,
+        max_retries: int = 3,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def start(self):
+        """Open the shared session"""
+        self._open()
+    
+    def _open(self):
+        if self._session and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_connections,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, connect=min(5.0, self.timeout)),
+            headers={"Accept": "application/json"}
+        )
+    
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Tasks started before setup_hook may get here first; open it on demand
+        self._open()
+        return self._session
+    
+    async def close(self):
+        """Close the shared session and its pooled connections"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _post_batch(self, path: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if not self.breaker:
+            return await self._post_with_retries(path, payload)
+        
+        self.breaker.check()
+        try:
+            entries = await self._post_with_retries(path, payload)
+        except aiohttp.ClientResponseError as e:
+            # A 4xx answer means Roblox is up; only outages and rate limits count
+            if 400 <= e.status < 500 and e.status != 429:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            # Cancelled by our side (shutdown, command timeout), which says nothing about Roblox
+            self.breaker.release()
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return entries
+    
+    async def _post_with_retries(self, path: str, payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                await self.limiter.acquire()
+            async with self.session.post(f"{USERS_API}{path}", json=payload) as response:
+                if response.status == 429 and attempt < self.max_retries:
+                    delay = parse_retry_after(response.headers.get("Retry-After"))
+                    logger.warning(f"Roblox API rate limited on {path}, retrying in {delay:.1f}s")
+                    if self.limiter:
+                        self.limiter.pause(delay)
+                    else:
+                        await asyncio.sleep(delay)
+                    continue
+                response.raise_for_status()
+                data = await response.json()
+            return data.get("data", [])
+    
+    async def _batched(self, path: str, field: str, values: List[Any]) -> List[Dict[str, Any]]:
+        """POST ``values`` in chunks of ``BATCH_SIZE`` concurrently; failed chunks are logged and skipped"""
+        chunks = [values[i:i + BATCH_SIZE] for i in range(0, len(values), BATCH_SIZE)]
+        results = await asyncio.gather(
+            *(self._post_batch(path, {field: chunk, "excludeBannedUsers": False}) for chunk in chunks),
+            return_exceptions=True
+        )
+        
+        entries = []
+        refused = 0
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, CircuitOpenError):
+                refused += len(chunk)
+            elif isinstance(result, Exception):
+                logger.error(f"Roblox batch lookup of {len(chunk)} {field} failed: {result!r}")
+            else:
+                entries.extend(result)
+        if refused:
+            logger.warning(f"Skipped looking up {refused} {field}: Roblox API circuit is open")
+        return entries
+    
+    async def resolve_usernames(self, usernames: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Look up many usernames at once
+        
+        Returns ``{lowercased username: {'id', 'name', 'displayName', ...}}``
+        for every username that exists. Usernames in a failed batch are
+        simply missing from the result.
+        """
+        unique = list(dict.fromkeys(username.lower() for username in usernames))
+        resolved = {}
+        for entry in await self._batched("/v1/usernames/users", "usernames", unique):
+            requested = entry.get("requestedUsername") or entry.get("name", "")
+            resolved[requested.lower()] = entry
+        return resolved
+    
+    async def get_users(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Fetch many users by ID at once
+        
+        Returns ``{user_id: {'id', 'name', 'displayName', ...}}`` for every
+        ID that exists. IDs in a failed batch are missing from the result.
+        """
+        unique = list(dict.fromkeys(int(user_id) for user_id in user_ids))
+        return {entry["id"]: entry for entry in await self._batched("/v1/users", "userIds", unique)}
+    
+    async def get_user_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        """Resolve one username to ``{'id', 'name', 'displayName', ...}`` in a single request"""
+        entries = await self._post_batch("/v1/usernames/users", {"usernames": [username], "excludeBannedUsers": False})
+        return entries[0] if entries else None
@@ -0,0 +1,309 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from utils.storage import GuildShards, dumps, peek, resident_items
+
+logger = logging.getLogger(__name__)
+
+class SqliteDatabase:
+    """SQLite connection confined to a single writer thread
+    
+    Every statement runs on the same dedicated thread, so there is exactly one
+    writer and the event loop never blocks on disk I/O.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self.conn: Optional[sqlite3.Connection] = None
+        self.call(self._connect)
+    
+    def _connect(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+    
+    def call(self, func: Callable, *args) -> Any:
+        """Run a function on the writer thread and wait for it (startup/shutdown only)"""
+        return self._executor.submit(func, *args).result()
+    
+    async def run(self, func: Callable, *args) -> Any:
+        """Run a function on the writer thread without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+    
+    def close(self):
+        """Checkpoint and close the connection"""
+        def _close():
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+        self.call(_close)
+        self._executor.shutdown(wait=True)
+
+class SqliteStore:
+    """One bot data store kept as rows of ``(guild_id, item_key, value)``
+    
+    For ``per_user`` stores each guild's users are separate rows, so an XP
+    gain or a new verification only upserts that user's row. Other stores
+    use one row per top-level key with an empty ``item_key``. ``lazy``
+    stores only read a guild's rows the first time that guild is accessed.
+    """
+    
+    def __init__(
+        self,
+        owner: Any,
+        name: str,
+        database: SqliteDatabase,
+        legacy_path: str,
+        per_user: bool,
+        lazy: bool = False,
+        guild_factory: Optional[Callable] = None
+    ):
+        self.owner = owner
+        self.name = name
+        self.database = database
+        self.legacy_path = legacy_path
+        self.per_user = per_user
+        self.lazy = lazy
+        self.guild_factory = guild_factory
+        self._dirty_items: Dict[str, Set[str]] = {}
+        self._dirty_keys: Set[str] = set()
+        self._dirty_all = False
+        self._data_id: Optional[int] = None
+        self.database.call(self._create_table)
+    
+    @property
+    def data(self) -> Any:
+        """The live object, read from the owner so reassignments are picked up"""
+        return getattr(self.owner, self.name)
+    
+    def _create_table(self):
+        with self.database.conn:
+            self.database.conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.name} ("
+                "guild_id TEXT NOT NULL, "
+                "item_key TEXT NOT NULL, "
+                "value TEXT NOT NULL, "
+                "PRIMARY KEY (guild_id, item_key)"
+                ") WITHOUT ROWID"
+            )
+    
+    def _select_all(self) -> List[Tuple[str, str, str]]:
+        return self.database.conn.execute(f"SELECT guild_id, item_key, value FROM {self.name}").fetchall()
+    
+    def _select_guild_ids(self) -> List[str]:
+        return [row[0] for row in self.database.conn.execute(f"SELECT DISTINCT guild_id FROM {self.name}")]
+    
+    def _select_guild(self, guild_id: str) -> Any:
+        rows = self.database.conn.execute(
+            f"SELECT item_key, value FROM {self.name} WHERE guild_id = ?",
+            (guild_id,)
+        ).fetchall()
+        if self.per_user:
+            return self._build_guild({item_key: json.loads(value) for item_key, value in rows})
+        return self._build_guild(json.loads(rows[0][1])) if rows else None
+    
+    def _build_guild(self, value: Any) -> Any:
+        return self.guild_factory(value) if self.guild_factory else value
+    
+    def _load_guild(self, guild_id: str) -> Any:
+        return self.database.call(self._select_guild, guild_id)
+    
+    async def ensure_loaded(self, guild_id: str):
+        """Read a guild's rows on the writer thread if it is known but not resident"""
+        data = self.data
+        if not isinstance(data, GuildShards) or guild_id not in data or data.is_resident(guild_id):
+            return
+        value = await self.database.run(self._select_guild, guild_id)
+        if not data.is_resident(guild_id):
+            data.install(guild_id, value if value is not None else {})
+    
+    def _read_json(self, path: str) -> Any:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            logger.error(f"Cannot import corrupt {path}: {e}")
+            return None
+    
+    def _read_legacy(self) -> Any:
+        """Data left by the JSON backend, or None if there is none
+        
+        That is the single file, or, once the sharded JSON store has split
+        it (renaming it to ``.migrated``), the per-guild files under
+        ``<data_dir>/<name>/``, which are newer than the renamed file.
+        """
+        data = self._read_json(self.legacy_path)
+        if data is not None:
+            return data
+        
+        shard_dir = os.path.join(os.path.dirname(self.legacy_path), self.name)
+        if os.path.isdir(shard_dir):
+            shards = {}
+            for filename in os.listdir(shard_dir):
+                if filename.endswith('.json'):
+                    value = self._read_json(os.path.join(shard_dir, filename))
+                    if value is not None:
+                        shards[filename[:-5]] = value
+            if shards:
+                return shards
+        
+        return self._read_json(self.legacy_path + ".migrated")
+    
+    def load(self, default: Any) -> Any:
+        """Load all rows (or just the guild index when lazy), importing the JSON backend's files the first time"""
+        if self.lazy:
+            guild_ids = self.database.call(self._select_guild_ids)
+            if guild_ids:
+                data = GuildShards(self._load_guild, guild_ids)
+                self._data_id = id(data)
+                return data
+        
+        rows = [] if self.lazy else self.database.call(self._select_all)
+        
+        if rows:
+            data = {}
+            for guild_id, item_key, value in rows:
+                if self.per_user:
+                    data.setdefault(guild_id, {})[item_key] = json.loads(value)
+                else:
+                    data[guild_id] = json.loads(value)
+        else:
+            data = self._read_legacy()
+            if data:
+                logger.info(f"Importing JSON data into SQLite table {self.name} ({len(data)} entries)")
+            elif data is None:
+                data = default if default is not None else {}
+            self._dirty_all = True
+        
+        if self.guild_factory:
+            data = {key: self._build_guild(value) for key, value in data.items()}
+        
+        if self.lazy:
+            shards = GuildShards(self._load_guild, [])
+            for guild_id, value in data.items():
+                shards.install(str(guild_id), value)
+            data = shards
+        
+        self._data_id = id(data)
+        return data
+    
+    def mark_dirty(self, key: Optional[str] = None, item: Optional[str] = None):
+        """Flag the whole store, one guild, or one user row of a guild"""
+        if key is None:
+            self._dirty_all = True
+        elif item is None or not self.per_user:
+            self._dirty_keys.add(str(key))
+        else:
+            self._dirty_items.setdefault(str(key), set()).add(str(item))
+    
+    @property
+    def dirty(self) -> bool:
+        return self._dirty_all or bool(self._dirty_keys) or bool(self._dirty_items) or id(self.data) != self._data_id
+    
+    def is_dirty(self, key: str) -> bool:
+        return self._dirty_all or key in self._dirty_keys or key in self._dirty_items
+    
+    def _rows_for(self, key: str, value: Any) -> List[Tuple[str, str, Any]]:
+        if self.per_user:
+            return [(key, str(item), copy.deepcopy(item_value)) for item, item_value in value.items()]
+        return [(key, '', copy.deepcopy(value))]
+    
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Copy the changed rows; must run on the event loop"""
+        if not self.dirty:
+            return None
+        
+        data = self.data
+        replaced = id(data) != self._data_id
+        snap = {
+            'dirty_all': self._dirty_all or replaced,
+            # Only a reassigned or fully resident store may drop the whole table
+            'clear_all': replaced or (self._dirty_all and not isinstance(data, GuildShards)),
+            'dirty_keys': self._dirty_keys,
+            'dirty_items': self._dirty_items,
+            'clear_guilds': [],
+            'deletes': [],
+            'upserts': []
+        }
+        
+        if snap['clear_all']:
+            for key, value in data.items():
+                snap['upserts'].extend(self._rows_for(str(key), value))
+        elif snap['dirty_all']:
+            for key, value in resident_items(data):
+                snap['clear_guilds'].append(key)
+                snap['upserts'].extend(self._rows_for(key, value))
+        else:
+            for key in self._dirty_keys:
+                value = peek(data, key)
+                if value is None and key in data:
+                    continue  # Known but not resident: nothing in memory to write
+                # Rewrite the guild's rows wholesale so removed users disappear too
+                snap['clear_guilds'].append(key)
+                if value is not None:
+                    snap['upserts'].extend(self._rows_for(key, value))
+            
+            for key, items in self._dirty_items.items():
+                if key in self._dirty_keys:
+                    continue
+                guild_data = peek(data, key)
+                if guild_data is None:
+                    if key in data:
+                        continue
+                    guild_data = {}
+                for item in items:
+                    if item in guild_data:
+                        snap['upserts'].append((key, item, copy.deepcopy(guild_data[item])))
+                    else:
+                        snap['deletes'].append((key, item))
+        
+        self._dirty_items = {}
+        self._dirty_keys = set()
+        self._dirty_all = False
+        self._data_id = id(data)
+        return snap
+    
+    def restore(self, snap: Dict[str, Any]):
+        """Re-flag a snapshot's changes after a failed write"""
+        if snap['dirty_all']:
+            self._dirty_all = True
+        self._dirty_keys |= snap['dirty_keys']
+        for key, items in snap['dirty_items'].items():
+            self._dirty_items.setdefault(key, set()).update(items)
+    
+    def write(self, snap: Dict[str, Any]):
+        """Apply a snapshot as one batched transaction; runs on the writer thread"""
+        conn = self.database.conn
+        with conn:
+            if snap['clear_all']:
+                conn.execute(f"DELETE FROM {self.name}")
+            if snap['clear_guilds']:
+                conn.executemany(
+                    f"DELETE FROM {self.name} WHERE guild_id = ?",
+                    [(key,) for key in snap['clear_guilds']]
+                )
+            if snap['deletes']:
+                conn.executemany(
+                    f"DELETE FROM {self.name} WHERE guild_id = ? AND item_key = ?",
+                    snap['deletes']
+                )
+            if snap['upserts']:
+                conn.executemany(
+                    f"INSERT INTO {self.name} (guild_id, item_key, value) VALUES (?, ?, ?) "
+                    "ON CONFLICT (guild_id, item_key) DO UPDATE SET value = excluded.value",
+                    [(key, item, dumps(value)) for key, item, value in snap['upserts']]
+                )
+    
+    async def commit(self, snap: Dict[str, Any]):
+        """Queue a snapshot on the single writer thread"""
+        await self.database.run(self.write, snap)
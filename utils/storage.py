@@ -0,0 +1,569 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+def fsync_directory(directory: str):
+    """Flush a directory entry so a rename inside it survives a crash"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # Directories can't be opened on some platforms (e.g. Windows)
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write(filepath: str, payload: str):
+    """Write text to a file via temp file + fsync + rename
+    
+    Readers (and a crash at any point) see either the old file or the new
+    one, never a truncated mix of both.
+    """
+    directory = os.path.dirname(filepath) or '.'
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f".{os.path.basename(filepath)}.",
+        suffix=".tmp",
+        dir=directory
+    )
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    fsync_directory(directory)
+
+def _encode(obj: Any) -> Any:
+    """JSON fallback for compact in-memory containers (e.g. XPTable)"""
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(data: Any) -> str:
+    """Serialize data in the compact on-disk format"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=_encode)
+
+class JsonStore:
+    """One JSON file whose top-level keys (usually guild IDs) are tracked for changes
+    
+    Each top-level key is serialized to its own fragment and cached, so a save
+    only re-serializes the keys that were marked dirty and stitches the file
+    back together from the cached fragments.
+    """
+    
+    def __init__(self, owner: Any, name: str, filepath: str, guild_factory: Optional[Callable] = None):
+        self.owner = owner
+        self.name = name
+        self.filepath = filepath
+        self.guild_factory = guild_factory
+        self._fragments: Dict[str, str] = {}
+        self._dirty_keys: Set[str] = set()
+        self._dirty_all = False
+        self._data_id: Optional[int] = None
+    
+    @property
+    def data(self) -> Any:
+        """The live object, read from the owner so reassignments are picked up"""
+        return getattr(self.owner, self.name)
+    
+    def load(self, default: Any) -> Any:
+        """Load the file, priming the fragment cache with what is on disk"""
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = default if default is not None else {}
+            self._dirty_all = True
+        
+        if isinstance(data, dict):
+            if self.guild_factory:
+                data = {key: self.guild_factory(value) for key, value in data.items()}
+            self._fragments = {str(key): dumps(value) for key, value in data.items()}
+        self._data_id = id(data)
+        return data
+    
+    def mark_dirty(self, key: Optional[str] = None, item: Optional[str] = None):
+        """Flag one top-level key, or the whole file when key is None
+        
+        JSON files are rewritten per top-level key, so ``item`` is ignored.
+        """
+        if key is None:
+            self._dirty_all = True
+        else:
+            self._dirty_keys.add(str(key))
+    
+    @property
+    def dirty(self) -> bool:
+        return self._dirty_all or bool(self._dirty_keys) or id(self.data) != self._data_id
+    
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Copy the changed parts of the store; must run on the event loop
+        
+        Returns None when nothing changed. Dirty flags are cleared here and
+        restored by ``restore`` if the write fails.
+        """
+        if not self.dirty:
+            return None
+        
+        data = self.data
+        snap = {
+            'keys': None,
+            'changed': None,
+            'whole': None,
+            'dirty_keys': self._dirty_keys,
+            'dirty_all': self._dirty_all or id(data) != self._data_id
+        }
+        
+        if isinstance(data, dict):
+            keys = [str(key) for key in data]
+            if snap['dirty_all']:
+                changed = keys
+            else:
+                changed = [key for key in keys if key in self._dirty_keys or key not in self._fragments]
+            snap['keys'] = keys
+            snap['changed'] = {key: copy.deepcopy(data[key]) for key in changed}
+        else:
+            snap['whole'] = copy.deepcopy(data)
+        
+        self._dirty_keys = set()
+        self._dirty_all = False
+        self._data_id = id(data)
+        return snap
+    
+    def restore(self, snap: Dict[str, Any]):
+        """Re-flag a snapshot's changes after a failed write"""
+        self._dirty_keys |= snap['dirty_keys']
+        if snap['changed'] is not None:
+            self._dirty_keys |= set(snap['changed'])
+        if snap['dirty_all'] or snap['whole'] is not None:
+            self._dirty_all = True
+    
+    def write(self, snap: Dict[str, Any]):
+        """Serialize a snapshot and commit it to disk; runs on a worker thread"""
+        if snap['whole'] is not None:
+            atomic_write(self.filepath, dumps(snap['whole']))
+            return
+        
+        fragments = {key: self._fragments[key] for key in snap['keys'] if key in self._fragments}
+        for key, value in snap['changed'].items():
+            fragments[key] = dumps(value)
+        
+        body = ','.join(f"{dumps(key)}:{fragments[key]}" for key in snap['keys'])
+        atomic_write(self.filepath, '{' + body + '}')
+        self._fragments = fragments
+    
+    async def commit(self, snap: Dict[str, Any]):
+        """Write a snapshot on a worker thread"""
+        await asyncio.to_thread(self.write, snap)
+    
+    def is_dirty(self, key: str) -> bool:
+        return self._dirty_all or key in self._dirty_keys
+    
+    async def ensure_loaded(self, key: str):
+        """Whole-file stores are always resident"""
+
+class GuildNotLoadedError(RuntimeError):
+    """A known guild was read before its owning store's ``ensure_loaded`` ran"""
+
+class GuildShards(MutableMapping):
+    """Guild ID -> guild data mapping that loads each guild on first access
+    
+    Only resident guilds are held in memory. Membership and iteration cover
+    every known guild without loading anything; ``evict`` drops a resident
+    guild again once its owning store has written it back.
+    
+    Loading on access blocks on disk I/O, so it is only allowed until
+    ``DataStore.start`` (e.g. for journal replay at startup). After that,
+    reading a guild that is not resident raises ``GuildNotLoadedError``;
+    await ``ensure_loaded`` first.
+    """
+    
+    def __init__(self, loader: Callable[[str], Optional[dict]], known: Iterable[str]):
+        self._loader = loader
+        self.sync_loads = True
+        self._known: Set[str] = set(known)
+        self._resident: 'OrderedDict[str, Any]' = OrderedDict()
+        self._last_access: Dict[str, float] = {}
+    
+    def _touch(self, guild_id: str):
+        self._resident.move_to_end(guild_id)
+        self._last_access[guild_id] = time.monotonic()
+    
+    def install(self, guild_id: str, value: Any):
+        """Make a guild resident with the given data"""
+        self._resident[guild_id] = value
+        self._known.add(guild_id)
+        self._touch(guild_id)
+    
+    def __getitem__(self, guild_id: str) -> Any:
+        if guild_id in self._resident:
+            self._touch(guild_id)
+            return self._resident[guild_id]
+        if guild_id not in self._known:
+            raise KeyError(guild_id)
+        if not self.sync_loads:
+            # Not a KeyError: callers must not mistake a known guild for a missing one
+            raise GuildNotLoadedError(f"guild {guild_id} is not loaded; await ensure_loaded() before reading it")
+        value = self._loader(guild_id)
+        self.install(guild_id, value if value is not None else {})
+        return self._resident[guild_id]
+    
+    def __setitem__(self, guild_id: str, value: Any):
+        self.install(guild_id, value)
+    
+    def __delitem__(self, guild_id: str):
+        if guild_id not in self._known:
+            raise KeyError(guild_id)
+        self._known.discard(guild_id)
+        self.evict(guild_id)
+    
+    def __contains__(self, guild_id: object) -> bool:
+        return guild_id in self._known
+    
+    def __iter__(self):
+        return iter(list(self._known))
+    
+    def __len__(self) -> int:
+        return len(self._known)
+    
+    def is_resident(self, guild_id: str) -> bool:
+        return guild_id in self._resident
+    
+    def peek(self, guild_id: str) -> Any:
+        """Resident data for a guild without loading it or refreshing its LRU position"""
+        return self._resident.get(guild_id)
+    
+    def resident_items(self) -> List[tuple]:
+        """Resident (guild_id, data) pairs, least recently used first"""
+        return list(self._resident.items())
+    
+    def last_access(self, guild_id: str) -> float:
+        return self._last_access.get(guild_id, 0.0)
+    
+    def evict(self, guild_id: str):
+        """Drop a guild from memory (it stays known and reloads on next access)"""
+        self._resident.pop(guild_id, None)
+        self._last_access.pop(guild_id, None)
+
+def resident_items(data: Any) -> List[tuple]:
+    """(key, value) pairs currently in memory, whether or not the store is sharded"""
+    if isinstance(data, GuildShards):
+        return data.resident_items()
+    return list(data.items())
+
+def peek(data: Any, key: str) -> Any:
+    """Value for a key if it is in memory (None otherwise), without touching the LRU"""
+    if isinstance(data, GuildShards):
+        return data.peek(key)
+    return data.get(key)
+
+class ShardedJsonStore:
+    """Store kept as one JSON file per guild under ``<data_dir>/<name>/``
+    
+    Guilds are loaded lazily through ``GuildShards`` and written back
+    individually, so memory and save cost follow the active guilds only.
+    """
+    
+    def __init__(self, owner: Any, name: str, directory: str, legacy_path: str, guild_factory: Optional[Callable] = None):
+        self.owner = owner
+        self.name = name
+        self.directory = directory
+        self.legacy_path = legacy_path
+        self.guild_factory = guild_factory
+        self._dirty_keys: Set[str] = set()
+        self._dirty_all = False
+        self._data_id: Optional[int] = None
+    
+    @property
+    def data(self) -> Any:
+        """The live object, read from the owner so reassignments are picked up"""
+        return getattr(self.owner, self.name)
+    
+    def shard_path(self, guild_id: str) -> str:
+        return os.path.join(self.directory, f"{guild_id}.json")
+    
+    def _read_shard(self, guild_id: str) -> Any:
+        try:
+            with open(self.shard_path(guild_id), 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except FileNotFoundError:
+            value = {}
+        except json.JSONDecodeError as e:
+            logger.error(f"Corrupt shard {self.shard_path(guild_id)}: {e}")
+            value = {}
+        return self.guild_factory(value) if self.guild_factory else value
+    
+    def _migrate_legacy(self):
+        """Split the old single-file store into per-guild shards
+        
+        Guilds that already have a shard keep it: the shard is newer than
+        anything a flat file written next to it (e.g. by an old setup
+        script) can hold.
+        """
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        
+        logger.info(f"Splitting {self.legacy_path} into per-guild shards")
+        for guild_id, value in legacy.items():
+            path = self.shard_path(str(guild_id))
+            if os.path.exists(path):
+                logger.warning(f"Keeping existing shard for guild {guild_id}; ignoring its data in {self.legacy_path}")
+                continue
+            atomic_write(path, dumps(value))
+        os.replace(self.legacy_path, self.legacy_path + ".migrated")
+    
+    def load(self, default: Any) -> GuildShards:
+        """Index the shards on disk without loading any of them"""
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        if os.path.exists(self.legacy_path):
+            self._migrate_legacy()
+        
+        known = [filename[:-5] for filename in os.listdir(self.directory) if filename.endswith('.json')]
+        data = GuildShards(self._read_shard, known)
+        self._data_id = id(data)
+        return data
+    
+    async def ensure_loaded(self, guild_id: str):
+        """Load a guild's shard on a worker thread if it is known but not resident"""
+        data = self.data
+        if not isinstance(data, GuildShards) or guild_id not in data or data.is_resident(guild_id):
+            return
+        value = await asyncio.to_thread(self._read_shard, guild_id)
+        if not data.is_resident(guild_id):
+            data.install(guild_id, value)
+    
+    def mark_dirty(self, key: Optional[str] = None, item: Optional[str] = None):
+        """Flag one guild, or every resident guild when key is None"""
+        if key is None:
+            self._dirty_all = True
+        else:
+            self._dirty_keys.add(str(key))
+    
+    @property
+    def dirty(self) -> bool:
+        return self._dirty_all or bool(self._dirty_keys) or id(self.data) != self._data_id
+    
+    def is_dirty(self, key: str) -> bool:
+        return self._dirty_all or key in self._dirty_keys
+    
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        """Copy the changed guilds; must run on the event loop"""
+        if not self.dirty:
+            return None
+        
+        data = self.data
+        replaced = id(data) != self._data_id
+        if replaced or self._dirty_all:
+            keys = [key for key, _ in resident_items(data)]
+        else:
+            keys = list(self._dirty_keys)
+        
+        snap = {
+            'dirty_keys': self._dirty_keys,
+            'dirty_all': self._dirty_all or replaced,
+            'changed': {},
+            'removed': [],
+            # A reassigned plain dict replaces the whole store, like a full rewrite would
+            'keep': {str(key) for key in data} if replaced else None
+        }
+        for key in keys:
+            if key not in data:
+                snap['removed'].append(key)
+            elif peek(data, key) is not None:
+                snap['changed'][key] = copy.deepcopy(peek(data, key))
+        
+        self._dirty_keys = set()
+        self._dirty_all = False
+        self._data_id = id(data)
+        return snap
+    
+    def restore(self, snap: Dict[str, Any]):
+        """Re-flag a snapshot's changes after a failed write"""
+        self._dirty_keys |= snap['dirty_keys'] | set(snap['changed']) | set(snap['removed'])
+        if snap['dirty_all']:
+            self._dirty_all = True
+    
+    def write(self, snap: Dict[str, Any]):
+        """Commit changed shards to disk; runs on a worker thread"""
+        for key, value in snap['changed'].items():
+            atomic_write(self.shard_path(key), dumps(value))
+        
+        stale = list(snap['removed'])
+        if snap['keep'] is not None:
+            stale += [
+                filename[:-5] for filename in os.listdir(self.directory)
+                if filename.endswith('.json') and filename[:-5] not in snap['keep']
+            ]
+        for key in stale:
+            try:
+                os.remove(self.shard_path(key))
+            except FileNotFoundError:
+                pass
+    
+    async def commit(self, snap: Dict[str, Any]):
+        """Write a snapshot on a worker thread"""
+        await asyncio.to_thread(self.write, snap)
+
+class DataStore:
+    """Dirty-tracked persistence for the bot's data
+    
+    Stores are named after the owner attribute that holds their data
+    (``bot.user_levels`` -> ``"user_levels"``), so cogs keep reading and
+    writing plain dicts and only need to call ``mark_dirty`` after a change.
+    The ``json`` backend keeps one file per store; the ``sqlite`` backend
+    keeps one row per guild (or per guild + user for ``per_user`` stores).
+    """
+    
+    BACKENDS = ('json', 'sqlite')
+    
+    def __init__(self, owner: Any, data_dir: str, backend: str = 'json'):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown storage backend: {backend}")
+        
+        self.owner = owner
+        self.data_dir = data_dir
+        self.backend = backend
+        self.stores: Dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+        self.database = None
+        
+        if backend == 'sqlite':
+            from utils.sqlite_storage import SqliteDatabase
+            self.database = SqliteDatabase(os.path.join(data_dir, "xlzr.db"))
+    
+    def register(
+        self,
+        name: str,
+        filename: str,
+        default: Any = None,
+        per_user: bool = False,
+        sharded: bool = False,
+        guild_factory: Optional[Callable] = None
+    ) -> Any:
+        """Register a store and return its loaded data
+        
+        ``per_user`` marks guild -> user -> value stores so the SQLite backend
+        can persist each user as its own row. ``sharded`` stores load each
+        guild lazily (one file per guild for JSON) and can be evicted.
+        ``guild_factory`` converts each loaded guild's plain dict into the
+        in-memory container used for it (e.g. ``XPTable``).
+        """
+        filepath = os.path.join(self.data_dir, filename)
+        if self.database:
+            from utils.sqlite_storage import SqliteStore
+            store = SqliteStore(self.owner, name, self.database, filepath, per_user, lazy=sharded, guild_factory=guild_factory)
+        elif sharded:
+            store = ShardedJsonStore(self.owner, name, os.path.join(self.data_dir, name), filepath, guild_factory)
+        else:
+            store = JsonStore(self.owner, name, filepath, guild_factory)
+        self.stores[name] = store
+        return store.load(default)
+    
+    def mark_dirty(self, name: str, key: Optional[str] = None, item: Optional[str] = None):
+        """Flag a store, one guild of it, or one user within that guild for the next flush"""
+        self.stores[name].mark_dirty(key, item)
+    
+    async def flush(self, *names: str) -> List[str]:
+        """Write every dirty store (or only the named ones) off the event loop
+        
+        Returns the names of the stores that were written.
+        """
+        async with self._lock:
+            targets = [self.stores[name] for name in names] if names else list(self.stores.values())
+            
+            # Snapshots are taken on the loop so each one is consistent
+            pending = []
+            for store in targets:
+                snap = store.snapshot()
+                if snap is not None:
+                    pending.append((store, snap))
+            
+            written = []
+            for store, snap in pending:
+                try:
+                    await store.commit(snap)
+                    written.append(store.name)
+                except Exception as e:
+                    store.restore(snap)
+                    logger.error(f"Error saving {store.name}: {e}")
+            return written
+    
+    def start(self):
+        """Stop loading sharded guilds synchronously once startup is done
+        
+        From here on guilds must be loaded with ``ensure_loaded``, so a
+        missed call fails loudly instead of blocking the event loop.
+        """
+        for store in self.stores.values():
+            if isinstance(store.data, GuildShards):
+                store.data.sync_loads = False
+    
+    async def ensure_loaded(self, name: str, guild_id: str):
+        """Load one guild of a sharded store off the event loop before it is accessed"""
+        await self.stores[name].ensure_loaded(guild_id)
+    
+    async def evict_idle(self, idle_seconds: float, max_resident: int = 0) -> int:
+        """Write back and unload guilds that are idle or over the memory budget
+        
+        ``max_resident`` caps the number of resident entries (users) per
+        store; 0 disables the cap. Returns the number of guilds evicted.
+        """
+        evicted = 0
+        for store in list(self.stores.values()):
+            shards = store.data
+            if not isinstance(shards, GuildShards):
+                continue
+            
+            now = time.monotonic()
+            resident = shards.resident_items()
+            candidates = {key for key, _ in resident if now - shards.last_access(key) >= idle_seconds}
+            
+            if max_resident:
+                total = sum(len(value) for _, value in resident)
+                for key, value in resident:
+                    if total <= max_resident:
+                        break
+                    candidates.add(key)
+                    total -= len(value)
+            
+            if not candidates:
+                continue
+            
+            # Write dirty guilds back first so nothing is lost on eviction
+            selected_at = {key: shards.last_access(key) for key in candidates}
+            if any(store.is_dirty(key) for key in candidates):
+                await self.flush(store.name)
+            
+            for key in candidates:
+                # Skip guilds that were touched or changed while we were saving
+                if store.is_dirty(key) or shards.last_access(key) != selected_at[key]:
+                    continue
+                shards.evict(key)
+                evicted += 1
+        return evicted
+    
+    def close(self):
+        """Release backend resources once the final flush is done"""
+        if self.database:
+            self.database.close()
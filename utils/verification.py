@@ -0,0 +1,167 @@
+import heapq
+import zlib
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+def verification_slice(user_id: str, slices: int) -> int:
+    """Time slice a verified user is rechecked in
+    
+    Based only on the Discord user ID, so it is stable across restarts and
+    a user verified in several servers is looked up once per pass.
+    """
+    return zlib.crc32(str(user_id).encode()) % slices
+
+def initial_due(user_id: str, now: float, interval: float, slices: int) -> float:
+    """First check time for a user who has never been checked
+    
+    Users get a fixed slot in each ``interval``-long cycle (from their slice),
+    so never-checked users are spread evenly and a restart does not push
+    them back.
+    """
+    offset = verification_slice(user_id, slices) * interval / slices
+    due = now - (now % interval) + offset
+    return due if due > now else due + interval
+
+def next_check_interval(current: float, changed: bool, base: float, cap: float, growth: float = 2.0) -> float:
+    """Back off for users whose display name stays the same; reset when it changes"""
+    if changed:
+        return base
+    return min(cap, max(base, current * growth))
+
+class RecheckScheduler:
+    """Min-heap of (due time, guild, user) for verified users
+    
+    Rescheduling pushes a new entry and remembers the latest due time per
+    user; stale heap entries are skipped when popped instead of being
+    removed in place.
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, str, str]] = []
+        self._due: Dict[Tuple[str, str], float] = {}
+    
+    def __len__(self) -> int:
+        return len(self._due)
+    
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self._due
+    
+    def schedule(self, guild_id: str, user_id: str, due: float):
+        self._due[(guild_id, user_id)] = due
+        heapq.heappush(self._heap, (due, guild_id, user_id))
+        # Compact once stale entries dominate the heap
+        if len(self._heap) > 2 * len(self._due) + 64:
+            self._heap = [(due, guild_id, user_id) for (guild_id, user_id), due in self._due.items()]
+            heapq.heapify(self._heap)
+    
+    def remove(self, guild_id: str, user_id: str):
+        self._due.pop((guild_id, user_id), None)
+    
+    def next_due(self) -> Optional[float]:
+        while self._heap:
+            due, guild_id, user_id = self._heap[0]
+            if self._due.get((guild_id, user_id)) == due:
+                return due
+            heapq.heappop(self._heap)
+        return None
+    
+    def pop_due(self, now: float, limit: int) -> List[Tuple[str, str]]:
+        """Remove and return up to ``limit`` users due at ``now``, earliest first"""
+        popped = []
+        while self._heap and len(popped) < limit:
+            due, guild_id, user_id = self._heap[0]
+            if due > now:
+                break
+            heapq.heappop(self._heap)
+            if self._due.get((guild_id, user_id)) == due:
+                del self._due[(guild_id, user_id)]
+                popped.append((guild_id, user_id))
+        return popped
+
+class VerificationIndex:
+    """Reverse index from Roblox account (ID and username) to verified Discord users
+    
+    Maps each account to ``{guild_id: {user_id, ...}}`` so finding who
+    claimed an account, in one server or all of them, needs no scan of
+    ``verification_data``. Records saved before IDs were stored are indexed
+    by username only.
+    """
+    
+    def __init__(self):
+        self._by_id: Dict[int, Dict[str, Set[str]]] = {}
+        self._by_name: Dict[str, Dict[str, Set[str]]] = {}
+        self._entries: Dict[Tuple[str, str], Tuple[Optional[int], Optional[str]]] = {}
+    
+    @classmethod
+    def build(cls, verification_data: Dict[str, Dict[str, Dict]]) -> 'VerificationIndex':
+        index = cls()
+        for guild_id, users in verification_data.items():
+            for user_id, user_data in users.items():
+                index.add(guild_id, user_id, user_data)
+        return index
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    @staticmethod
+    def _link(table: Dict, key, guild_id: str, user_id: str):
+        table.setdefault(key, {}).setdefault(guild_id, set()).add(user_id)
+    
+    @staticmethod
+    def _unlink(table: Dict, key, guild_id: str, user_id: str):
+        guilds = table.get(key)
+        if guilds is None:
+            return
+        users = guilds.get(guild_id)
+        if users is not None:
+            users.discard(user_id)
+            if not users:
+                del guilds[guild_id]
+        if not guilds:
+            del table[key]
+    
+    def add(self, guild_id: str, user_id: str, user_data: Dict):
+        """Index (or re-index, after a rename) one verification record"""
+        roblox_id = user_data.get('roblox_id')
+        username = user_data.get('roblox_username')
+        entry = (int(roblox_id) if roblox_id is not None else None, username.lower() if username else None)
+        if self._entries.get((guild_id, user_id)) == entry:
+            return
+        self.remove(guild_id, user_id)
+        self._entries[(guild_id, user_id)] = entry
+        if entry[0] is not None:
+            self._link(self._by_id, entry[0], guild_id, user_id)
+        if entry[1] is not None:
+            self._link(self._by_name, entry[1], guild_id, user_id)
+    
+    def remove(self, guild_id: str, user_id: str):
+        entry = self._entries.pop((guild_id, user_id), None)
+        if entry is None:
+            return
+        if entry[0] is not None:
+            self._unlink(self._by_id, entry[0], guild_id, user_id)
+        if entry[1] is not None:
+            self._unlink(self._by_name, entry[1], guild_id, user_id)
+    
+    def claims(self, roblox: Union[int, str], guild_id: Optional[str] = None) -> Set[Tuple[str, str]]:
+        """``(guild_id, user_id)`` pairs verified as an account, given its ID or username
+        
+        A string of digits is looked up both as an ID and as a username.
+        """
+        tables = []
+        if isinstance(roblox, int) or str(roblox).isdigit():
+            tables.append(self._by_id.get(int(roblox), {}))
+        if isinstance(roblox, str):
+            tables.append(self._by_name.get(roblox.lower(), {}))
+        
+        found = set()
+        for guilds in tables:
+            if guild_id is not None:
+                found.update((guild_id, user_id) for user_id in guilds.get(guild_id, ()))
+            else:
+                for claim_guild, users in guilds.items():
+                    found.update((claim_guild, user_id) for user_id in users)
+        return found
+    
+    def guild_count(self, roblox_id: int) -> int:
+        """Number of servers an account is verified in"""
+        return len(self._by_id.get(int(roblox_id), {}))
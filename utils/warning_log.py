@@ -0,0 +1,338 @@
+import asyncio
+import bisect
+import heapq
+import json
+import logging
+import os
+import re
+from collections.abc import MutableMapping
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"\w+")
+
+# (issued_at, user_id, warning_id): unique per warning and sorts by time
+WarningKey = Tuple[float, str, int]
+
+def issued_at(warning: Dict[str, Any]) -> float:
+    """Unix time a warning was issued (its ISO ``timestamp``), 0 if unreadable"""
+    try:
+        return datetime.fromisoformat(warning['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+def reason_tokens(text: str) -> Set[str]:
+    """Lowercased words of a warning reason, as indexed for search"""
+    return set(TOKEN.findall(text.lower()))
+
+def moderator_keys(warning: Dict[str, Any]) -> Set[str]:
+    """Index keys for who issued a warning; older warnings only stored the name"""
+    keys = set()
+    if warning.get('moderator_id') is not None:
+        keys.add(f"id:{warning['moderator_id']}")
+    if warning.get('moderator'):
+        keys.add(f"name:{warning['moderator'].lower()}")
+    return keys
+
+def merge_legacy_file(path: str, user_warnings: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    """Merge a warnings file left by the old moderation cog, then rename it to ``.migrated``
+    
+    The old cog kept guild -> user -> warnings in the working directory and
+    numbered warnings per user, so imported warnings get new guild-wide IDs;
+    ones already present (same timestamp and reason) are skipped. Returns
+    the (guild, user) pairs touched.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            legacy = json.load(f)
+    except FileNotFoundError:
+        return set()
+    except json.JSONDecodeError as e:
+        logger.error(f"Cannot merge corrupt {path}: {e}")
+        return set()
+    
+    touched = set()
+    for guild_id, users in legacy.items():
+        guild_id = str(guild_id)
+        if guild_id not in user_warnings:
+            user_warnings[guild_id] = WarningLog()
+        log = user_warnings[guild_id]
+        for user_id, warnings in users.items():
+            user_id = str(user_id)
+            seen = {(w.get('timestamp'), w.get('reason')) for w in log.get(user_id, ())}
+            for warning in warnings:
+                if (warning.get('timestamp'), warning.get('reason')) in seen:
+                    continue
+                log.add(user_id, {key: value for key, value in warning.items() if key != 'id'})
+                touched.add((guild_id, user_id))
+    
+    logger.info(f"Merged {path} into the warnings store ({len(touched)} users)")
+    os.replace(path, path + ".migrated")
+    return touched
+
+class WarningSearch:
+    """Secondary indexes over one guild's warnings for ``!modlog``
+    
+    Keeps every warning's key sorted by issue time (for date ranges) plus
+    moderator -> keys and reason word -> keys sets. A query intersects the
+    sets it needs, smallest first, and only sorts what matched.
+    
+    Built from ``(user_id, warnings)`` pairs; see ``WarningLog.search``.
+    """
+    
+    def __init__(self, entries: Iterable[Tuple[str, List[Dict[str, Any]]]]):
+        self._warnings: Dict[WarningKey, Dict[str, Any]] = {}
+        self._by_moderator: Dict[str, Set[WarningKey]] = {}
+        self._by_token: Dict[str, Set[WarningKey]] = {}
+        for user_id, warnings in entries:
+            for warning in warnings:
+                self._index(self.key(user_id, warning), warning)
+        self._by_time: List[WarningKey] = sorted(self._warnings)
+    
+    def __len__(self) -> int:
+        return len(self._warnings)
+    
+    @staticmethod
+    def key(user_id: str, warning: Dict[str, Any]) -> WarningKey:
+        return (issued_at(warning), str(user_id), int(warning.get('id', 0)))
+    
+    def _index(self, key: WarningKey, warning: Dict[str, Any]):
+        self._warnings[key] = warning
+        for moderator in moderator_keys(warning):
+            self._by_moderator.setdefault(moderator, set()).add(key)
+        for token in reason_tokens(warning.get('reason', '')):
+            self._by_token.setdefault(token, set()).add(key)
+    
+    def add(self, user_id: str, warning: Dict[str, Any]):
+        key = self.key(user_id, warning)
+        self._index(key, warning)
+        bisect.insort(self._by_time, key)
+    
+    def remove(self, user_id: str, warning: Dict[str, Any]):
+        key = self.key(user_id, warning)
+        if self._warnings.pop(key, None) is None:
+            return
+        position = bisect.bisect_left(self._by_time, key)
+        if position < len(self._by_time) and self._by_time[position] == key:
+            del self._by_time[position]
+        for table, names in ((self._by_moderator, moderator_keys(warning)), (self._by_token, reason_tokens(warning.get('reason', '')))):
+            for name in names:
+                keys = table.get(name)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del table[name]
+    
+    def get(self, key: WarningKey) -> Dict[str, Any]:
+        return self._warnings[key]
+    
+    def query(
+        self,
+        moderators: Optional[Iterable[str]] = None,
+        users: Optional[Set[WarningKey]] = None,
+        words: Iterable[str] = (),
+        since: Optional[float] = None,
+        until: Optional[float] = None
+    ) -> List[WarningKey]:
+        """Keys of the warnings matching every given filter, newest first
+        
+        ``moderators`` are ``moderator_keys`` (any may match), ``words`` must
+        all appear in the reason, and ``since``/``until`` bound the issue time
+        (until is exclusive).
+        """
+        sets = []
+        if moderators is not None:
+            matched = set()
+            for moderator in moderators:
+                matched |= self._by_moderator.get(moderator, set())
+            sets.append(matched)
+        if users is not None:
+            sets.append(users)
+        for word in words:
+            sets.append(self._by_token.get(word.lower(), set()))
+        
+        if not sets:
+            low = bisect.bisect_left(self._by_time, (since,)) if since is not None else 0
+            high = bisect.bisect_left(self._by_time, (until,)) if until is not None else len(self._by_time)
+            return self._by_time[low:high][::-1]
+        
+        sets.sort(key=len)
+        matched = sets[0].intersection(*sets[1:])
+        if since is not None or until is not None:
+            matched = [
+                key for key in matched
+                if (since is None or key[0] >= since) and (until is None or key[0] < until)
+            ]
+        return sorted(matched, reverse=True)
+
+class WarningLog(MutableMapping):
+    """One guild's warnings, kept as an append-only log with a per-user index
+    
+    Maps user ID -> that user's warnings, oldest first, which is also the
+    JSON shape on disk. Warning IDs are unique within the guild, so a
+    journalled warning that is already present can be recognised and
+    skipped on replay.
+    
+    Warnings with an ``expires_at`` time are also kept in a min-heap, so
+    ``expire`` only touches the warnings that are actually due. Expired
+    warnings stay in the log (and in ``!modlog``) marked ``expired``;
+    ``count`` returns a per-user counter of the active ones, kept up to
+    date by every change, so threshold checks don't scan the list.
+    
+    The ``!modlog`` search indexes are built in a worker thread on first use
+    and then updated with every change.
+    """
+    
+    __slots__ = ('_users', '_active', '_expiry', '_search', '_building', '_pending', 'next_id')
+    
+    def __init__(self, records: Mapping[str, List[Dict[str, Any]]] = None):
+        self._users: Dict[str, List[Dict[str, Any]]] = {}
+        self._active: Dict[str, int] = {}
+        self._expiry: List[Tuple[float, int, str]] = []
+        self._search: Optional[WarningSearch] = None
+        self._building: Optional[asyncio.Future] = None
+        self._pending: Optional[List[Tuple[str, str, Dict[str, Any]]]] = None
+        self.next_id = 1
+        if records:
+            for user_id, warnings in records.items():
+                self[user_id] = warnings
+    
+    def __getitem__(self, user_id: Any) -> List[Dict[str, Any]]:
+        return self._users[str(user_id)]
+    
+    def __setitem__(self, user_id: Any, warnings: List[Dict[str, Any]]):
+        user_id = str(user_id)
+        warnings = list(warnings)
+        for warning in self._users.get(user_id, ()):
+            self._index('remove', user_id, warning)
+        self._users[user_id] = warnings
+        self._active[user_id] = sum(1 for warning in warnings if not warning.get('expired'))
+        for warning in warnings:
+            self.next_id = max(self.next_id, int(warning.get('id', 0)) + 1)
+            self._schedule(user_id, warning)
+            self._index('add', user_id, warning)
+    
+    def __delitem__(self, user_id: Any):
+        for warning in self._users.pop(str(user_id)):
+            self._index('remove', str(user_id), warning)
+        self._active.pop(str(user_id), None)
+    
+    def __contains__(self, user_id: object) -> bool:
+        return str(user_id) in self._users
+    
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._users)
+    
+    def __len__(self) -> int:
+        return len(self._users)
+    
+    def add(self, user_id: str, warning: Dict[str, Any]) -> Dict[str, Any]:
+        """Append a warning, giving it the next guild-wide ID if it has none"""
+        if 'id' not in warning:
+            warning['id'] = self.next_id
+        self.next_id = max(self.next_id, int(warning['id']) + 1)
+        self._users.setdefault(str(user_id), []).append(warning)
+        if not warning.get('expired'):
+            self._active[str(user_id)] = self._active.get(str(user_id), 0) + 1
+        self._schedule(str(user_id), warning)
+        self._index('add', str(user_id), warning)
+        return warning
+    
+    def _schedule(self, user_id: str, warning: Dict[str, Any]):
+        if warning.get('expires_at') is not None and not warning.get('expired'):
+            heapq.heappush(self._expiry, (warning['expires_at'], warning['id'], user_id))
+    
+    def remove(self, user_id: str, warning: Dict[str, Any]):
+        warnings = self._users.get(str(user_id))
+        if warnings is None:
+            return
+        try:
+            warnings.remove(warning)
+        except ValueError:
+            return
+        if not warning.get('expired'):
+            self._active[str(user_id)] -= 1
+        if not warnings:
+            del self._users[str(user_id)]
+            del self._active[str(user_id)]
+        self._index('remove', str(user_id), warning)
+    
+    def next_expiry(self) -> Optional[float]:
+        return self._expiry[0][0] if self._expiry else None
+    
+    def expire(self, now: float) -> List[Tuple[str, Dict[str, Any]]]:
+        """Mark warnings whose ``expires_at`` has passed as expired; returns them as ``(user_id, warning)``"""
+        expired = []
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, warning_id, user_id = heapq.heappop(self._expiry)
+            warning = self.find(user_id, warning_id)
+            # Skip entries left over from a removed or already expired warning
+            if warning is not None and warning.get('expires_at') == expires_at and not warning.get('expired'):
+                warning['expired'] = True
+                self._active[user_id] -= 1
+                expired.append((user_id, warning))
+        return expired
+    
+    def find(self, user_id: str, warning_id: int) -> Optional[Dict[str, Any]]:
+        for warning in reversed(self._users.get(str(user_id), ())):
+            if warning.get('id') == warning_id:
+                return warning
+        return None
+    
+    def _index(self, operation: str, user_id: str, warning: Dict[str, Any]):
+        """Apply an add/remove to the search indexes, or queue it while they are being built"""
+        if self._search is not None:
+            getattr(self._search, operation)(user_id, warning)
+        elif self._pending is not None:
+            self._pending.append((operation, user_id, warning))
+    
+    async def search(self) -> WarningSearch:
+        """Search indexes, built in a worker thread on first use and then kept up to date"""
+        if self._search is not None:
+            return self._search
+        if self._building is None:
+            self._building = asyncio.ensure_future(self._build_search())
+        # Shield so one cancelled command does not cancel a build others are waiting for
+        return await asyncio.shield(self._building)
+    
+    async def _build_search(self) -> WarningSearch:
+        # The thread indexes a copy of the user lists; changes made meanwhile are queued and applied after
+        self._pending = []
+        snapshot = [(user_id, list(warnings)) for user_id, warnings in self._users.items()]
+        try:
+            search = await asyncio.to_thread(WarningSearch, snapshot)
+            for operation, user_id, warning in self._pending:
+                getattr(search, operation)(user_id, warning)
+            self._search = search
+            return search
+        finally:
+            self._pending = None
+            self._building = None
+    
+    def user_keys(self, user_id: str) -> Set[WarningKey]:
+        return {WarningSearch.key(user_id, warning) for warning in self._users.get(str(user_id), ())}
+    
+    def active(self, user_id: str) -> List[Dict[str, Any]]:
+        """A user's warnings that have not expired, oldest first"""
+        return [warning for warning in self._users.get(str(user_id), ()) if not warning.get('expired')]
+    
+    def count(self, user_id: str) -> int:
+        """Number of active warnings a user has"""
+        return self._active.get(str(user_id), 0)
+    
+    def to_dict(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {user_id: list(warnings) for user_id, warnings in self._users.items()}
+    
+    def __deepcopy__(self, memo: dict) -> 'WarningLog':
+        # Warnings are flat dicts of strings and numbers, so a copy per warning is enough
+        log = WarningLog()
+        log._users = {user_id: [dict(w) for w in warnings] for user_id, warnings in self._users.items()}
+        log._active = dict(self._active)
+        log._expiry = list(self._expiry)
+        log.next_id = self.next_id
+        return log
+    
+    def __repr__(self) -> str:
+        return f"WarningLog({len(self)} users)"
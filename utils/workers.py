@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+class PoolResult:
+    """Outcome counts of a ``WorkerPool.run``"""
+    
+    __slots__ = ('total', 'succeeded', 'failed', 'elapsed')
+    
+    def __init__(self, total: int):
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.elapsed = 0.0
+    
+    @property
+    def done(self) -> int:
+        return self.succeeded + self.failed
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+class WorkerPool:
+    """Process items with a fixed number of concurrent workers
+    
+    Errors from one item are logged and counted without stopping the rest.
+    Progress (done/total, rate and ETA) is logged every ``progress_interval``
+    seconds while the pool runs, and passed to ``on_progress`` if given.
+    """
+    
+    def __init__(self, name: str, concurrency: int, progress_interval: float = 30.0):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.progress_interval = progress_interval
+    
+    async def run(
+        self,
+        items: Iterable[Any],
+        worker: Callable[[Any], Awaitable[Any]],
+        on_progress: Optional[Callable[[PoolResult], Awaitable[Any]]] = None
+    ) -> PoolResult:
+        queue: asyncio.Queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+        result = PoolResult(queue.qsize())
+        started = time.monotonic()
+        
+        async def work():
+            while True:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await worker(item)
+                    result.succeeded += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    result.failed += 1
+                    logger.error(f"{self.name}: error processing {item!r}: {e}")
+        
+        async def report():
+            while True:
+                await asyncio.sleep(self.progress_interval)
+                elapsed = time.monotonic() - started
+                rate = result.done / elapsed if elapsed else 0.0
+                eta = (result.total - result.done) / rate if rate else 0.0
+                logger.info(
+                    f"{self.name}: {result.done}/{result.total} done "
+                    f"({rate:.1f}/s, {result.failed} failed, ETA {format_duration(eta)})"
+                )
+                if on_progress is not None:
+                    try:
+                        await on_progress(result)
+                    except Exception as e:
+                        logger.warning(f"{self.name}: progress callback failed: {e}")
+        
+        workers = [asyncio.create_task(work()) for _ in range(min(self.concurrency, result.total))]
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            for task in workers:
+                task.cancel()
+        result.elapsed = time.monotonic() - started
+        return result